@@ -0,0 +1,576 @@
+"""Offline end-to-end benchmark for /api/search/stream.
+
+Craigslist, the chat models and Mapbox are replaced by local stand-ins, so
+runs are repeatable and free:
+
+    python benchmark.py --clients 8 --searches 40 --llm-latency 0.8
+
+Search pages are generated in the static-results markup of
+fixtures/search_list.html and posting pages are fixtures/posting.html with
+per-post titles, prices, bodies and photos, so deduplication and the caches
+behave as they would on distinct listings.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+from urllib.parse import parse_qsl, unquote, urlencode, urlsplit
+
+import httpx
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+_WORDS = (
+    "bright quiet sunny spacious renovated charming cozy classic modern top-floor "
+    "corner garden hardwood laundry dishwasher parking storage balcony deck views "
+    "bay park transit muni bart cafes shops restaurants block walk steps from "
+    "kitchen closet bedroom living room windows light lease deposit utilities "
+    "included available now november december pets cats dogs ok no smoking"
+).split()
+_STREETS = ["Grant Ave", "Union St", "Columbus Ave", "Stockton St", "Green St", "Vallejo St"]
+_HOODS = ["north beach", "telegraph hill", "russian hill", "nob hill", "chinatown"]
+
+_SEARCH_CARD = """      <li class="cl-static-search-result" title="{title}">
+        <a href="{url}">
+          <div class="title">{title}</div>
+          <div class="details">
+            <div class="price">${price:,}</div>
+            <div class="location">{hood}</div>
+          </div>
+        </a>
+      </li>"""
+
+
+@dataclass
+class Posting:
+    post_id: str
+    title: str
+    price: int
+    hood: str
+    address: str
+    body: str
+    image_ids: List[str]
+    has_map: bool
+    street_address: bool
+
+
+def _posting(post_id: str, geocode_ratio: float, llm_geocode_ratio: float) -> Posting:
+    rng = random.Random(int(post_id))
+    bedrooms = rng.randint(1, 3)
+    title = (
+        f"{rng.choice(_WORDS).title()} {bedrooms}BR {rng.choice(_WORDS)} "
+        f"{rng.choice(_WORDS)} {post_id[-4:]}"
+    )
+    street_address = rng.random() >= llm_geocode_ratio
+    if street_address:
+        address = f"{rng.randint(100, 2999)} {rng.choice(_STREETS)}"
+    else:
+        address = f"near {rng.choice(_STREETS)} and {rng.choice(_STREETS)}"
+    return Posting(
+        post_id=post_id,
+        title=title,
+        price=rng.randrange(2500, 4500, 5),
+        hood=rng.choice(_HOODS),
+        address=address,
+        body=" ".join(rng.choice(_WORDS) for _ in range(60)),
+        image_ids=[
+            f"{rng.randrange(16**5):05X}_{rng.randrange(36**11):011x}_0CI0t2"
+            for _ in range(2)
+        ],
+        has_map=rng.random() >= geocode_ratio,
+        street_address=street_address,
+    )
+
+
+@lru_cache(maxsize=None)
+def _fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES_DIR, name)) as f:
+        return f.read()
+
+
+def render_posting(posting: Posting) -> str:
+    html = _fixture("posting.html")
+    html = html.replace("Sunny 2BR flat with bay views", posting.title)
+    html = html.replace("$3,950", f"${posting.price:,}")
+    html = html.replace("north beach / telegraph hill", posting.hood)
+    html = html.replace("1234 Grant Ave", posting.address)
+    html = html.replace("7791234501", posting.post_id)
+    html = re.sub(
+        r"(<section id=\"postingbody\">.*?</div>\s*</div>).*?(</section>)",
+        lambda match: f"{match.group(1)}\n      {posting.body}\n    {match.group(2)}",
+        html,
+        flags=re.DOTALL,
+    )
+    for original, image_id in zip(
+        ("00K0K_5Ueylf0Xc5Z_0CI0t2", "00909_gPy1nSn2yIP_0CI0t2"), posting.image_ids
+    ):
+        html = html.replace(original, image_id)
+        html = html.replace(original.split("_")[1], image_id.split("_")[1])
+
+    if not posting.has_map:
+        html = html.replace(
+            ' data-latitude="37.800312" data-longitude="-122.410105"', ""
+        )
+        html = html.replace('"latitude":37.800312,"longitude":-122.410105,', "")
+    return html
+
+
+class StandInServer(ThreadingHTTPServer):
+    """Serves search pages, posting pages and Mapbox geocoding responses."""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        results_per_search: int,
+        page_size: int,
+        page_latency: float,
+        geocode_latency: float,
+        geocode_ratio: float,
+        llm_geocode_ratio: float,
+    ):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.results_per_search = results_per_search
+        self.page_size = page_size
+        self.page_latency = page_latency
+        self.geocode_latency = geocode_latency
+        self.geocode_ratio = geocode_ratio
+        self.llm_geocode_ratio = llm_geocode_ratio
+        self.requests = {"search": 0, "posting": 0, "geocode": 0}
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, kind: str):
+        with self._lock:
+            self.requests[kind] += 1
+
+    def search_page(self, query: str) -> str:
+        params = [(key, value) for key, value in parse_qsl(query) if key != "s"]
+        offset = int(dict(parse_qsl(query)).get("s", 0))
+        # Post IDs depend on the filters, so every distinct search sees its
+        # own listings.
+        first_id = 7_800_000_000 + zlib.crc32(urlencode(params).encode()) % 100_000 * 1000
+
+        cards = []
+        for index in range(offset, min(offset + self.page_size, self.results_per_search)):
+            posting = self.posting(str(first_id + index))
+            cards.append(
+                _SEARCH_CARD.format(
+                    title=posting.title,
+                    url=f"{self.base_url}/sfc/apa/d/bench/{posting.post_id}.html",
+                    price=posting.price,
+                    hood=posting.hood,
+                )
+            )
+        return (
+            '<!DOCTYPE html>\n<html lang="en">\n<body class="search">\n'
+            '    <ol class="cl-static-search-results">\n'
+            + "\n".join(cards)
+            + "\n    </ol>\n</body>\n</html>\n"
+        )
+
+    def posting(self, post_id: str) -> Posting:
+        return _posting(post_id, self.geocode_ratio, self.llm_geocode_ratio)
+
+    def geocode(self, search_text: str) -> dict:
+        rng = random.Random(zlib.crc32(search_text.encode()))
+        coordinates = [-122.41 + rng.uniform(-0.02, 0.02), 37.80 + rng.uniform(-0.02, 0.02)]
+        return {
+            "type": "FeatureCollection",
+            "features": [{"geometry": {"type": "Point", "coordinates": coordinates}}],
+        }
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    server: StandInServer
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        match = re.search(r"/(\d{8,})\.html$", parts.path)
+
+        if parts.path.endswith("/search/apa"):
+            self.server.count("search")
+            time.sleep(self.server.page_latency)
+            self._send(self.server.search_page(parts.query), "text/html")
+        elif match:
+            self.server.count("posting")
+            time.sleep(self.server.page_latency)
+            self._send(render_posting(self.server.posting(match.group(1))), "text/html")
+        elif parts.path.startswith("/geocoding/v5/mapbox.places/"):
+            self.server.count("geocode")
+            time.sleep(self.server.geocode_latency)
+            search_text = unquote(parts.path.rsplit("/", 1)[-1]).removesuffix(".json")
+            self._send(json.dumps(self.server.geocode(search_text)), "application/json")
+        else:
+            self.send_error(404)
+
+    def _send(self, body: str, content_type: str):
+        data = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_DESCRIPTION = re.compile(r"<Description>\s*(.*?)\s*</Description>", re.DOTALL)
+_LISTING = re.compile(r"<Listing index=(\d+)>(.*?)</Listing>", re.DOTALL)
+_LOCATION = re.compile(r"^Location: (.*)$", re.MULTILINE)
+_ADDRESS = re.compile(r"^Address \(if available\): (.*)$", re.MULTILINE)
+
+
+def _search_text(listing_prompt: str) -> str:
+    address = _ADDRESS.search(listing_prompt)
+    location = _LOCATION.search(listing_prompt)
+    location = location.group(1).strip() if location else "San Francisco, CA"
+    if address and address.group(1).strip() != "Not provided":
+        return f"{address.group(1).strip()}, {location}"
+    return location
+
+
+def fake_structured_output(schema, prompt: str):
+    """What a well-behaved model would answer for the prompts in prompts.py."""
+    from models import GeocodingQueries, GeocodingQuery, Requirements
+    from requirements_parser import parse_requirements
+
+    if schema is Requirements:
+        match = _DESCRIPTION.search(prompt)
+        requirements = parse_requirements(match.group(1) if match else prompt).requirements
+        return {**requirements, "location": requirements["location"] or "San Francisco"}
+    if schema is GeocodingQuery:
+        return GeocodingQuery(search_text=_search_text(prompt), limit=1, autocomplete=False)
+    if schema is GeocodingQueries:
+        return GeocodingQueries(
+            queries=[
+                {
+                    "listing_index": int(index),
+                    "search_text": _search_text(listing),
+                    "limit": 1,
+                    "autocomplete": False,
+                }
+                for index, listing in _LISTING.findall(prompt)
+            ]
+        )
+    raise NotImplementedError(f"no fake output for {schema!r}")
+
+
+def fake_chat_model_factory(latency: float):
+    """Build a get_chat_model() replacement answering after ``latency`` seconds."""
+    from langchain_core.language_models.chat_models import BaseChatModel
+    from langchain_core.messages import AIMessage
+    from langchain_core.outputs import ChatGeneration, ChatResult
+    from langchain_core.runnables import RunnableLambda
+
+    from metrics import UsageCallbackHandler
+
+    class FakeChatModel(BaseChatModel):
+        latency: float = 0.0
+
+        @property
+        def _llm_type(self) -> str:
+            return "benchmark-fake"
+
+        def _result(self, messages) -> ChatResult:
+            prompt = "".join(str(message.content) for message in messages)
+            message = AIMessage(
+                content="{}",
+                usage_metadata={
+                    "input_tokens": len(prompt) // 4,
+                    "output_tokens": 64,
+                    "total_tokens": len(prompt) // 4 + 64,
+                },
+            )
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+        def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+            time.sleep(self.latency)
+            return self._result(messages)
+
+        async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+            await asyncio.sleep(self.latency)
+            return self._result(messages)
+
+        def with_structured_output(self, schema, **kwargs):
+            async def respond(prompt):
+                # Go through ainvoke so latency, callbacks and usage counters
+                # behave like a real structured-output call.
+                await self.ainvoke(prompt)
+                text = prompt if isinstance(prompt, str) else str(prompt)
+                return fake_structured_output(schema, text)
+
+            return RunnableLambda(respond)
+
+    @lru_cache(maxsize=None)
+    def get_chat_model(model: str):
+        return FakeChatModel(latency=latency, callbacks=[UsageCallbackHandler(model)])
+
+    return get_chat_model
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return peak * scale / 1024 / 1024
+
+
+@dataclass
+class SearchSample:
+    seconds: float
+    first_listing_seconds: Optional[float]
+    listings: int
+    error: Optional[str] = None
+
+
+async def run_search(client: httpx.AsyncClient, url: str, payload: dict) -> SearchSample:
+    started = time.perf_counter()
+    first_listing = None
+    listings = 0
+    error = None
+
+    try:
+        async with client.stream("POST", url, json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[len("data: "):])
+                if event["type"] == "listing":
+                    listings += 1
+                    if first_listing is None:
+                        first_listing = time.perf_counter() - started
+                elif event["type"] == "error":
+                    error = event.get("message")
+    except httpx.HTTPError as e:
+        error = repr(e)
+
+    return SearchSample(time.perf_counter() - started, first_listing, listings, error)
+
+
+async def drive(api_url: str, args) -> List[SearchSample]:
+    pending = list(range(args.searches))
+    samples: List[SearchSample] = []
+
+    async def client_loop(client: httpx.AsyncClient):
+        while pending:
+            index = pending.pop(0)
+            # Distinct budgets make distinct searches, so coalescing doesn't
+            # fold the whole benchmark into one run.
+            payload = {
+                "description": f"2 bedroom in north beach, san francisco under ${5000 + index}",
+                "planner": "gpt-4o",
+                "executor": "gpt-4o-mini",
+                "headless_mode": True,
+                "max_listings": args.max_listings,
+            }
+            samples.append(await run_search(client, api_url, payload))
+
+    timeout = httpx.Timeout(args.timeout, connect=5.0)
+    async with httpx.AsyncClient(timeout=timeout) as client:
+        await asyncio.gather(*(client_loop(client) for _ in range(args.clients)))
+    return samples
+
+
+async def benchmark(args) -> dict:
+    stand_in = StandInServer(
+        results_per_search=args.results,
+        page_size=int(os.environ.get("SEARCH_PAGE_SIZE", "120")),
+        page_latency=args.page_latency,
+        geocode_latency=args.geocode_latency,
+        geocode_ratio=args.geocode_ratio,
+        llm_geocode_ratio=args.llm_geocode_ratio,
+    )
+    threading.Thread(target=stand_in.serve_forever, daemon=True).start()
+
+    # Module-level settings are read at import time, so point everything at
+    # the stand-ins before the app is imported.
+    os.environ.update(
+        {
+            "CRAIGSLIST_SEARCH_URL_TEMPLATE": f"{stand_in.base_url}/{{region}}/search/apa",
+            "MAPBOX_GEOCODING_URL": f"{stand_in.base_url}/geocoding/v5/mapbox.places",
+            "MAPBOX_ACCESS_TOKEN": "benchmark",
+            "DATA_DIR": args.data_dir or tempfile.mkdtemp(prefix="craigslist-bench-"),
+            "JOB_WORKERS": "0",
+            "ANONYMIZED_TELEMETRY": "false",
+        }
+    )
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    os.environ.setdefault("ANTHROPIC_API_KEY", "benchmark")
+
+    import uvicorn
+
+    import graph
+    import main
+    from browser_pool import browser_pool_stats
+    from metrics import LLM_CALLS, search_run_stats
+
+    get_chat_model = fake_chat_model_factory(args.llm_latency)
+    graph.get_chat_model = get_chat_model
+    main.get_chat_model = get_chat_model
+
+    port = _free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    started = time.perf_counter()
+    try:
+        samples = await drive(f"http://127.0.0.1:{port}/api/search/stream", args)
+    finally:
+        elapsed = time.perf_counter() - started
+        server.should_exit = True
+        await serving
+        stand_in.shutdown()
+
+    succeeded = [sample for sample in samples if sample.error is None]
+    latencies = [sample.seconds for sample in succeeded]
+    first_listing = [
+        sample.first_listing_seconds
+        for sample in succeeded
+        if sample.first_listing_seconds is not None
+    ]
+
+    return {
+        "clients": args.clients,
+        "searches": len(samples),
+        "errors": len(samples) - len(succeeded),
+        "listings": sum(sample.listings for sample in samples),
+        "elapsed_seconds": elapsed,
+        "throughput_searches_per_second": len(succeeded) / elapsed if elapsed else 0.0,
+        "latency_p50_seconds": percentile(latencies, 50),
+        "latency_p95_seconds": percentile(latencies, 95),
+        "first_listing_p50_seconds": percentile(first_listing, 50),
+        "first_listing_p95_seconds": percentile(first_listing, 95),
+        "browser_launches": sum(
+            stats["launches"] for stats in browser_pool_stats().values()
+        ),
+        "peak_rss_mb": peak_rss_mb(),
+        "llm_calls": int(LLM_CALLS.total()),
+        "search_runs": search_run_stats(),
+        "stand_in_requests": dict(stand_in.requests),
+    }
+
+
+async def check_geocode_concurrency(args) -> dict:
+    """Two concurrent searches where only Mapbox is slow.
+
+    Every posting lacks map coordinates and has a street address, so each
+    listing costs one Mapbox request and no LLM call. If lookups were
+    serialized the run would take at least requests x latency; it passes when
+    it takes under half that.
+    """
+    args.clients = args.searches = 2
+    args.page_latency = args.llm_latency = 0.0
+    args.geocode_latency = max(args.geocode_latency, 0.3)
+    args.geocode_ratio = 1.0
+    args.llm_geocode_ratio = 0.0
+    args.data_dir = None
+
+    report = await benchmark(args)
+    geocodes = report["stand_in_requests"]["geocode"]
+    serialized = geocodes * args.geocode_latency
+    return {
+        "geocode_requests": geocodes,
+        "geocode_latency_seconds": args.geocode_latency,
+        "serialized_seconds": serialized,
+        "elapsed_seconds": report["elapsed_seconds"],
+        "errors": report["errors"],
+        "passed": (
+            report["errors"] == 0
+            and geocodes > 0
+            and report["elapsed_seconds"] < serialized / 2
+        ),
+    }
+
+
+def _format(value) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return str(value)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark /api/search/stream offline")
+    parser.add_argument("--clients", type=int, default=4, help="concurrent SSE clients")
+    parser.add_argument("--searches", type=int, default=20, help="total searches")
+    parser.add_argument("--max-listings", type=int, default=10)
+    parser.add_argument("--results", type=int, default=60, help="results per search")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="seconds per LLM call")
+    parser.add_argument("--page-latency", type=float, default=0.1, help="seconds per page")
+    parser.add_argument("--geocode-latency", type=float, default=0.05)
+    parser.add_argument(
+        "--geocode-ratio",
+        type=float,
+        default=0.5,
+        help="fraction of postings without map coordinates",
+    )
+    parser.add_argument(
+        "--llm-geocode-ratio",
+        type=float,
+        default=0.5,
+        help="fraction of postings whose address needs an LLM geocoding query",
+    )
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--data-dir", help="reuse a DATA_DIR (warm caches)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument(
+        "--check-geocode-concurrency",
+        action="store_true",
+        help="fail unless two searches' Mapbox lookups overlap",
+    )
+    args = parser.parse_args()
+
+    if args.check_geocode_concurrency:
+        report = asyncio.run(check_geocode_concurrency(args))
+    else:
+        report = asyncio.run(benchmark(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for key, value in report.items():
+            print(f"{key:34} {_format(value)}")
+    if report.get("passed") is False:
+        sys.exit(1)
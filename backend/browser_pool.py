@@ -0,0 +1,154 @@
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional
+
+from browser_use import Browser, BrowserConfig, BrowserContextConfig
+
+from metrics import span
+
+BROWSER_POOL_SIZE = int(os.environ.get("BROWSER_POOL_SIZE", "2"))
+BROWSER_POOL_CONTEXTS_PER_BROWSER = int(
+    os.environ.get("BROWSER_POOL_CONTEXTS_PER_BROWSER", "4")
+)
+BROWSER_POOL_MAX_USES = int(os.environ.get("BROWSER_POOL_MAX_USES", "25"))
+
+
+@dataclass
+class PoolStats:
+    launches: int = 0
+    reuse_hits: int = 0
+    leases: int = 0
+    recycled: int = 0
+    cancelled: int = 0
+    wait_seconds: float = 0.0
+
+
+@dataclass
+class _Slot:
+    browser: Optional[Browser] = None
+    uses: int = 0
+    active: int = 0
+
+
+class BrowserPool:
+    """Keeps a few warm Chromium instances and leases out fresh contexts.
+
+    Every lease gets its own BrowserContext, so cookies and pages never leak
+    between agents. A browser is closed and relaunched once it has served
+    ``max_uses`` contexts to keep long-running processes from bloating.
+    """
+
+    def __init__(
+        self,
+        browser_config: BrowserConfig,
+        context_config: BrowserContextConfig,
+        size: int = BROWSER_POOL_SIZE,
+        contexts_per_browser: int = BROWSER_POOL_CONTEXTS_PER_BROWSER,
+        max_uses: int = BROWSER_POOL_MAX_USES,
+    ):
+        self._browser_config = browser_config
+        self._context_config = context_config
+        self._max_uses = max_uses
+        self._slots: List[_Slot] = [_Slot() for _ in range(size)]
+        self._semaphore = asyncio.Semaphore(size * contexts_per_browser)
+        self._lock = asyncio.Lock()
+        self.stats = PoolStats()
+
+    @asynccontextmanager
+    async def context(self):
+        started = time.perf_counter()
+        with span("browser.wait"):
+            await self._semaphore.acquire()
+        self.stats.wait_seconds += time.perf_counter() - started
+
+        slot = None
+        try:
+            slot = await self._checkout()
+            async with await slot.browser.new_context(config=self._context_config) as context:
+                yield slot.browser, context
+        except asyncio.CancelledError:
+            self.stats.cancelled += 1
+            raise
+        finally:
+            if slot is not None:
+                await self._checkin(slot)
+            self._semaphore.release()
+
+    async def _checkout(self) -> _Slot:
+        async with self._lock:
+            slot = min(
+                self._slots,
+                key=lambda slot: (slot.uses >= self._max_uses, slot.active),
+            )
+
+            if slot.browser is None:
+                browser = Browser(config=self._browser_config)
+                # Launch under the lock so concurrent leases don't race to
+                # start two Chromium processes for the same slot.
+                try:
+                    with span("browser.launch"):
+                        await browser.get_playwright_browser()
+                except BaseException:
+                    # Don't leave a half-started Chromium behind when the
+                    # search that asked for it is cancelled.
+                    await browser.close()
+                    raise
+                slot.browser = browser
+                self.stats.launches += 1
+            else:
+                self.stats.reuse_hits += 1
+
+            slot.uses += 1
+            slot.active += 1
+            self.stats.leases += 1
+            return slot
+
+    async def _checkin(self, slot: _Slot):
+        retired = None
+        async with self._lock:
+            slot.active -= 1
+            if slot.uses >= self._max_uses and slot.active == 0:
+                retired, slot.browser, slot.uses = slot.browser, None, 0
+                self.stats.recycled += 1
+
+        if retired is not None:
+            await retired.close()
+
+    async def close(self):
+        async with self._lock:
+            browsers = [slot.browser for slot in self._slots if slot.browser]
+            for slot in self._slots:
+                slot.browser, slot.uses = None, 0
+
+        for browser in browsers:
+            await browser.close()
+
+
+_pools: Dict[bool, BrowserPool] = {}
+
+
+def get_browser_pool(headless: bool) -> BrowserPool:
+    pool = _pools.get(headless)
+    if pool is None:
+        pool = BrowserPool(
+            browser_config=BrowserConfig(headless=headless),
+            context_config=BrowserContextConfig(allowed_domains=["craigslist.org"]),
+        )
+        _pools[headless] = pool
+    return pool
+
+
+def browser_pool_stats() -> Dict[str, dict]:
+    return {
+        "headless" if headless else "headful": asdict(pool.stats)
+        for headless, pool in _pools.items()
+    }
+
+
+async def close_browser_pools():
+    for pool in list(_pools.values()):
+        await pool.close()
+    _pools.clear()
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import os
+import time
+from contextlib import aclosing
+from dataclasses import asdict, dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from models import Requirements
+from regions import normalize_location
+
+COALESCE_RESULT_TTL_SECONDS = float(os.environ.get("COALESCE_RESULT_TTL_SECONDS", "60"))
+
+_DONE = object()
+
+
+def search_key(requirements: Requirements, settings: dict) -> str:
+    """Identical searches share a key: same normalized requirements and the
+    settings that change what comes back (not headless mode, concurrency or
+    extraction mode)."""
+    normalized = {
+        key: float(value) if isinstance(value, (int, float)) else value
+        for key, value in requirements.items()
+    }
+    normalized["location"] = normalize_location(requirements.get("location") or "")
+    return json.dumps(
+        {
+            "requirements": normalized,
+            "executor": settings["executor"],
+            "planner": settings["planner"],
+            "max_listings": settings["max_listings"],
+            "search_agent_fallback": settings["search_agent_fallback"],
+        },
+        sort_keys=True,
+    )
+
+
+@dataclass
+class CoalesceStats:
+    runs: int = 0
+    attached: int = 0
+    cache_hits: int = 0
+    subscribers: int = 0
+
+
+@dataclass
+class _Flight:
+    events: List[dict] = field(default_factory=list)
+    subscribers: List[Tuple[asyncio.Queue, Callable[[], Awaitable[bool]]]] = field(
+        default_factory=list
+    )
+    task: Optional[asyncio.Task] = None
+    finished_at: Optional[float] = None
+
+
+class SingleFlight:
+    """One in-flight run per key, its events fanned out to every subscriber.
+
+    Late subscribers get the events so far replayed before the live ones.
+    A run that completed within ``ttl`` seconds is replayed from memory. The
+    run is cancelled only once every subscriber has gone away.
+    """
+
+    def __init__(self, ttl: float = COALESCE_RESULT_TTL_SECONDS):
+        self._ttl = ttl
+        self._flights: Dict[str, _Flight] = {}
+        self.stats = CoalesceStats()
+
+    def _purge(self):
+        now = time.monotonic()
+        for key, flight in list(self._flights.items()):
+            if flight.finished_at is not None and now - flight.finished_at >= self._ttl:
+                del self._flights[key]
+
+    async def subscribe(
+        self,
+        key: str,
+        run: Callable[[Callable[[], Awaitable[bool]]], AsyncIterator[dict]],
+        is_disconnected: Callable[[], Awaitable[bool]],
+    ) -> AsyncIterator[dict]:
+        """Yield the events of the run for ``key``, starting it with
+        ``run(should_cancel)`` if nothing is in flight or cached."""
+        self._purge()
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.create_task(self._drive(key, flight, run))
+            self.stats.runs += 1
+        elif flight.finished_at is None:
+            self.stats.attached += 1
+        else:
+            self.stats.cache_hits += 1
+
+        queue = asyncio.Queue()
+        for event in flight.events:
+            queue.put_nowait(event)
+
+        subscriber = (queue, is_disconnected)
+        if flight.finished_at is None:
+            flight.subscribers.append(subscriber)
+            self.stats.subscribers += 1
+        else:
+            queue.put_nowait(_DONE)
+
+        try:
+            while (event := await queue.get()) is not _DONE:
+                if isinstance(event, Exception):
+                    raise event
+                yield event
+        finally:
+            if subscriber in flight.subscribers:
+                flight.subscribers.remove(subscriber)
+                self.stats.subscribers -= 1
+            if not flight.subscribers and flight.finished_at is None:
+                flight.task.cancel()
+
+    async def _drive(self, key: str, flight: _Flight, run):
+        async def abandoned():
+            return all([await is_disconnected() for _, is_disconnected in flight.subscribers])
+
+        try:
+            async with aclosing(run(abandoned)) as events:
+                async for event in events:
+                    flight.events.append(event)
+                    for queue, _ in flight.subscribers:
+                        queue.put_nowait(event)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            for queue, _ in flight.subscribers:
+                queue.put_nowait(e)
+        finally:
+            flight.finished_at = time.monotonic()
+            for queue, _ in flight.subscribers:
+                queue.put_nowait(_DONE)
+
+            # Only complete runs are worth replaying
+            completed = flight.events and flight.events[-1].get("type") == "complete"
+            if not completed and self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def stats_dict(self) -> dict:
+        return {**asdict(self.stats), "in_flight": sum(
+            flight.finished_at is None for flight in self._flights.values()
+        )}
+
+
+search_flights = SingleFlight()
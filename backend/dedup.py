@@ -0,0 +1,152 @@
+import hashlib
+import os
+import random
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from models import ListingDetails, ListingUrl
+from parsers import listing_post_id, parse_image_id
+
+CARD_TITLE_SIMILARITY = float(os.environ.get("DEDUP_CARD_TITLE_SIMILARITY", "0.6"))
+CONTENT_SIMILARITY = float(os.environ.get("DEDUP_CONTENT_SIMILARITY", "0.7"))
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+
+_WORD = re.compile(r"[a-z0-9$]+")
+_PRIME = (1 << 61) - 1
+_rng = random.Random(1729)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME))
+    for _ in range(MINHASH_PERMUTATIONS)
+]
+
+
+class DuplicateListing(Exception):
+    def __init__(self, post_id: str, original_post_id: str):
+        super().__init__(f"{post_id} duplicates {original_post_id}")
+        self.post_id = post_id
+        self.original_post_id = original_post_id
+
+
+def _words(text: Optional[str]) -> List[str]:
+    return _WORD.findall((text or "").lower())
+
+
+def shingles(text: Optional[str], size: int = 3) -> Set[str]:
+    words = _words(text)
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+def character_shingles(text: Optional[str], size: int = 3) -> Set[str]:
+    text = " ".join(_words(text))
+    return {text[i : i + size] for i in range(max(len(text) - size + 1, 0))}
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _hash(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "big")
+
+
+def minhash(tokens: Iterable[str]) -> Tuple[int, ...]:
+    hashes = [_hash(token) for token in tokens]
+    if not hashes:
+        return ()
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def _estimated_similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    return sum(x == y for x, y in zip(a, b)) / MINHASH_PERMUTATIONS
+
+
+def _content_tokens(details: ListingDetails) -> Set[str]:
+    tokens = shingles(details.description, size=5)
+    # Reposts usually reuse the photos, which keep their image IDs
+    tokens.update(f"img:{image_id}" for image_id in map(parse_image_id, details.images) if image_id)
+    return tokens
+
+
+def _price(text: Optional[str]) -> Optional[str]:
+    return re.sub(r"[^\d]", "", text or "") or None
+
+
+class ListingDeduplicator:
+    """Collapses reposts of the same unit within one search run.
+
+    ``check_card`` runs on search result cards before anything is fetched,
+    using the thumbnail's image ID and title shingles under the same price
+    and neighborhood. ``check_details`` runs once a posting is parsed,
+    before the agent or geocoder spends anything on it, with MinHash/LSH over
+    the description and image IDs. Both raise DuplicateListing and record
+    the merge in ``merged`` (kept post ID -> merged post IDs).
+    """
+
+    def __init__(
+        self,
+        card_similarity: float = CARD_TITLE_SIMILARITY,
+        content_similarity: float = CONTENT_SIMILARITY,
+    ):
+        self._card_similarity = card_similarity
+        self._content_similarity = content_similarity
+        self._thumbnails: Dict[str, str] = {}
+        self._cards: Dict[Tuple[Optional[str], str], List[Tuple[str, Set[str]]]] = defaultdict(list)
+        self._signatures: Dict[str, Tuple[int, ...]] = {}
+        self._bands: Dict[Tuple[int, Tuple[int, ...]], List[str]] = defaultdict(list)
+        self.merged: Dict[str, List[str]] = defaultdict(list)
+
+    def _merge(self, post_id: str, original: str):
+        self.merged[original].append(post_id)
+        raise DuplicateListing(post_id, original)
+
+    def check_card(self, listing: ListingUrl):
+        post_id = listing_post_id(listing)
+        if post_id is None or post_id in self._signatures:
+            return
+
+        thumbnail = parse_image_id(getattr(listing, "thumbnail", None))
+        if thumbnail:
+            original = self._thumbnails.get(thumbnail)
+            if original and original != post_id:
+                self._merge(post_id, original)
+
+        price = _price(getattr(listing, "price", None))
+        title = character_shingles(getattr(listing, "title", None))
+        key = (getattr(listing, "neighborhood", None) or "").lower()
+        if price and title:
+            for original, original_title in self._cards[(price, key)]:
+                if original != post_id and jaccard(title, original_title) >= self._card_similarity:
+                    self._merge(post_id, original)
+            self._cards[(price, key)].append((post_id, title))
+
+        if thumbnail:
+            self._thumbnails.setdefault(thumbnail, post_id)
+
+    def check_details(self, post_id: Optional[str], details: ListingDetails):
+        if post_id is None or post_id in self._signatures:
+            return
+
+        signature = minhash(_content_tokens(details))
+        if not signature:
+            return
+
+        rows = MINHASH_PERMUTATIONS // LSH_BANDS
+        bands = [(band, signature[band * rows : (band + 1) * rows]) for band in range(LSH_BANDS)]
+
+        candidates = {original for band in bands for original in self._bands.get(band, [])}
+        for original in sorted(candidates):
+            if original == post_id:
+                continue
+            similarity = _estimated_similarity(signature, self._signatures[original])
+            if similarity >= self._content_similarity:
+                self._merge(post_id, original)
+
+        self._signatures[post_id] = signature
+        for band in bands:
+            self._bands[band].append(post_id)
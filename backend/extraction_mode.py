@@ -0,0 +1,122 @@
+import dataclasses
+import os
+from typing import List, Optional
+
+from browser_use import Agent
+from browser_use.dom.views import DOMBaseNode, DOMElementNode, DOMTextNode
+
+TEXT_SNAPSHOT_MAX_ELEMENT_TEXT = int(os.environ.get("TEXT_SNAPSHOT_MAX_ELEMENT_TEXT", "120"))
+
+# Where free text is worth sending: the result cards and posting sections
+# parsers.py reads, and forms (the sidebar filters). Everything else on the
+# page only reaches the model as interactive elements.
+_CONTAINER_CLASSES = {
+    "cl-static-search-result",
+    "cl-search-result",
+    "result-row",
+    "postingtitletext",
+    "attrgroup",
+    "mapaddress",
+}
+_CONTAINER_IDS = {"postingbody", "titletextonly"}
+_CONTAINER_TAGS = {"form"}
+
+
+def _is_container(node: DOMElementNode) -> bool:
+    classes = set((node.attributes.get("class") or "").split())
+    return (
+        node.tag_name in _CONTAINER_TAGS
+        or node.attributes.get("id") in _CONTAINER_IDS
+        or bool(classes & _CONTAINER_CLASSES)
+    )
+
+
+def _element_line(node: DOMElementNode, include_attributes: List[str]) -> str:
+    # Same shape as browser_use's own serialization, so the system prompt's
+    # description of "[index]<tag>text/>" still holds.
+    text = node.get_all_text_till_next_clickable_element()
+    if len(text) > TEXT_SNAPSHOT_MAX_ELEMENT_TEXT:
+        text = text[:TEXT_SNAPSHOT_MAX_ELEMENT_TEXT] + "..."
+
+    attributes = sorted(
+        {
+            str(value)
+            for key, value in node.attributes.items()
+            if key in include_attributes and value != node.tag_name and value != text
+        }
+    )
+    line = f"[{node.highlight_index}]<{node.tag_name} {';'.join(attributes)}"
+    if text:
+        line += f">{text}" if attributes else text
+    return line + "/>"
+
+
+class TextSnapshot:
+    """Stands in for the element tree in an agent's state message.
+
+    Interactive elements are kept (they are the agent's action space) with
+    their text truncated; free text is kept only inside listing containers
+    and forms.
+    """
+
+    def __init__(self, root: DOMElementNode):
+        self._root = root
+
+    def clickable_elements_to_string(self, include_attributes: List[str] = []) -> str:
+        lines = []
+
+        def visit(node: DOMBaseNode, keep_text: bool):
+            if isinstance(node, DOMElementNode):
+                keep_text = keep_text or _is_container(node)
+                if node.highlight_index is not None:
+                    lines.append(_element_line(node, include_attributes))
+                for child in node.children:
+                    visit(child, keep_text)
+            elif isinstance(node, DOMTextNode):
+                if keep_text and node.is_visible and not node.has_parent_with_highlight_index():
+                    lines.append(node.text)
+
+        visit(self._root, False)
+        return "\n".join(lines)
+
+
+class ExtractionAgent(Agent):
+    """Agent whose steps use screenshots ("vision") or a text snapshot ("text").
+
+    In text mode the screenshot is only sent for the step after a failed
+    one, and the step after that goes back to text.
+    """
+
+    def __init__(self, *args, extraction_mode: str = "vision", **kwargs):
+        text_mode = extraction_mode == "text"
+        if text_mode:
+            kwargs["use_vision"] = False
+            kwargs["use_vision_for_planner"] = False
+        super().__init__(*args, **kwargs)
+
+        self.extraction_mode = extraction_mode
+        self.vision_steps = 0
+
+        if text_mode:
+            add_state_message = self._message_manager.add_state_message
+
+            def add_text_state_message(state, result=None, step_info=None, use_vision=True):
+                if not use_vision:
+                    state = dataclasses.replace(
+                        state, element_tree=TextSnapshot(state.element_tree)
+                    )
+                add_state_message(state, result, step_info, use_vision)
+
+            self._message_manager.add_state_message = add_text_state_message
+
+    def _last_step_failed(self) -> bool:
+        return self.state.consecutive_failures > 0 or any(
+            result.error for result in self.state.last_result or []
+        )
+
+    async def step(self, step_info: Optional[object] = None) -> None:
+        if self.extraction_mode == "text":
+            self.settings.use_vision = self._last_step_failed()
+        if self.settings.use_vision:
+            self.vision_steps += 1
+        await super().step(step_info)
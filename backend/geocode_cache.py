@@ -0,0 +1,145 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import List, Optional, Tuple
+
+from regions import normalize_location
+from storage import connect
+
+GEOCODE_CACHE_TTL_SECONDS = float(
+    os.environ.get("GEOCODE_CACHE_TTL_SECONDS", str(30 * 24 * 3600))
+)
+GEOCODE_CACHE_NEGATIVE_TTL_SECONDS = float(
+    os.environ.get("GEOCODE_CACHE_NEGATIVE_TTL_SECONDS", "3600")
+)
+GEOCODE_CACHE_MEMORY_SIZE = int(os.environ.get("GEOCODE_CACHE_MEMORY_SIZE", "2048"))
+
+MISS = object()
+
+
+@dataclass
+class GeocodeCacheStats:
+    hits: int = 0
+    misses: int = 0
+    memory_hits: int = 0
+    disk_hits: int = 0
+    negative_hits: int = 0
+    writes: int = 0
+
+
+class GeocodeCache:
+    """Mapbox coordinates keyed by normalized search text.
+
+    A bounded in-memory LRU sits in front of a SQLite table. Failed lookups
+    are stored as None with a much shorter TTL so a flaky Mapbox response
+    doesn't pin a listing to [0, 0] for a month. Rows are tiny and local, so
+    the SQLite calls run inline on the event loop.
+    """
+
+    def __init__(
+        self,
+        filename: str = "geocode_cache.sqlite3",
+        ttl: float = GEOCODE_CACHE_TTL_SECONDS,
+        negative_ttl: float = GEOCODE_CACHE_NEGATIVE_TTL_SECONDS,
+        memory_size: int = GEOCODE_CACHE_MEMORY_SIZE,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.memory_size = memory_size
+        self.stats = GeocodeCacheStats()
+        self._memory: "OrderedDict[str, Tuple[Optional[List[float]], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = connect(filename)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS geocode_cache ("
+            " key TEXT PRIMARY KEY,"
+            " coordinates TEXT,"
+            " expires_at REAL NOT NULL)"
+        )
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return normalize_location(text or "")
+
+    def get(self, text: str):
+        """Return cached coordinates, None for a cached failure, or MISS."""
+        key = self.normalize(text)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[1] > now:
+                self._memory.move_to_end(key)
+                self.stats.memory_hits += 1
+                return self._hit(entry[0])
+
+            row = self._db.execute(
+                "SELECT coordinates, expires_at FROM geocode_cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+
+            if row is None or row[1] <= now:
+                self._memory.pop(key, None)
+                self.stats.misses += 1
+                return MISS
+
+            coordinates = json.loads(row[0]) if row[0] else None
+            self._remember(key, coordinates, row[1])
+            self.stats.disk_hits += 1
+            return self._hit(coordinates)
+
+    def set(self, text: str, coordinates: Optional[List[float]]):
+        key = self.normalize(text)
+        if not key:
+            return
+
+        ttl = self.ttl if coordinates else self.negative_ttl
+        expires_at = time.time() + ttl
+
+        with self._lock:
+            self._remember(key, coordinates, expires_at)
+            self._db.execute(
+                "INSERT OR REPLACE INTO geocode_cache (key, coordinates, expires_at)"
+                " VALUES (?, ?, ?)",
+                (key, json.dumps(coordinates) if coordinates else None, expires_at),
+            )
+            self.stats.writes += 1
+
+    def purge_expired(self):
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM geocode_cache WHERE expires_at <= ?", (time.time(),)
+            )
+
+    def stats_dict(self) -> dict:
+        lookups = self.stats.hits + self.stats.misses
+        return {
+            **asdict(self.stats),
+            "hit_ratio": self.stats.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+        }
+
+    def _hit(self, coordinates):
+        self.stats.hits += 1
+        if coordinates is None:
+            self.stats.negative_hits += 1
+        return coordinates
+
+    def _remember(self, key, coordinates, expires_at):
+        self._memory[key] = (coordinates, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+
+_cache: Optional[GeocodeCache] = None
+
+
+def get_geocode_cache() -> GeocodeCache:
+    global _cache
+    if _cache is None:
+        _cache = GeocodeCache()
+    return _cache
@@ -0,0 +1,232 @@
+import asyncio
+import os
+import re
+import time
+from typing import List, Optional, Tuple
+from urllib.parse import quote
+
+from dotenv import load_dotenv
+
+from geocode_cache import MISS, get_geocode_cache
+from http_client import request_with_retries
+from llm_cache import MISS as LLM_CACHE_MISS, get_llm_cache, model_name
+from metrics import span, timed
+from models import GeocodingQueries, GeocodingQuery, ListingDetails
+from prompts import (
+    batch_geocoding_listing_template,
+    batch_geocoding_prompt,
+    geocoding_prompt,
+)
+
+load_dotenv()
+
+MAPBOX_ACCESS_TOKEN = os.environ.get("MAPBOX_ACCESS_TOKEN")
+MAPBOX_GEOCODING_URL = os.environ.get(
+    "MAPBOX_GEOCODING_URL", "https://api.mapbox.com/geocoding/v5/mapbox.places"
+)
+
+GEOCODE_BATCH_WINDOW_SECONDS = float(os.environ.get("GEOCODE_BATCH_WINDOW_SECONDS", "0.25"))
+GEOCODE_BATCH_MAX_SIZE = int(os.environ.get("GEOCODE_BATCH_MAX_SIZE", "20"))
+
+# Descriptions are truncated in batch prompts; the location signal is almost
+# always in the first few paragraphs.
+GEOCODE_BATCH_DESCRIPTION_CHARS = 1500
+
+_STREET_ADDRESS = re.compile(
+    r"^\s*\d+[a-z]?\s+(?:[nsew]\.?\s+)?[\w .'-]+?\s"
+    r"(?:st|street|ave|avenue|blvd|boulevard|rd|road|dr|drive|way|ln|lane|pl|place"
+    r"|ct|court|ter|terrace|pkwy|parkway|hwy|highway|cir|circle|sq|square|aly|alley)\b",
+    re.IGNORECASE,
+)
+
+
+def mapbox_params(geocoding_query: Optional[GeocodingQuery] = None) -> dict:
+    params = {"access_token": MAPBOX_ACCESS_TOKEN, "limit": 1}
+    if geocoding_query is None:
+        return params
+
+    if geocoding_query.proximity_point and len(geocoding_query.proximity_point) == 2:
+        params["proximity"] = ",".join(str(v) for v in geocoding_query.proximity_point)
+    if geocoding_query.country:
+        params["country"] = ",".join(geocoding_query.country)
+    if geocoding_query.types:
+        params["types"] = ",".join(geocoding_query.types)
+    if geocoding_query.autocomplete is not None:
+        params["autocomplete"] = str(geocoding_query.autocomplete).lower()
+    return params
+
+
+async def mapbox_geocode(
+    search_text: str, geocoding_query: Optional[GeocodingQuery] = None
+) -> Optional[List[float]]:
+    if not MAPBOX_ACCESS_TOKEN or not search_text:
+        return None
+
+    cache = get_geocode_cache()
+    cached = cache.get(search_text)
+    if cached is not MISS:
+        return cached
+
+    request_url = f"{MAPBOX_GEOCODING_URL}/{quote(search_text, safe='')}.json"
+    with span("geocode.mapbox"):
+        response = await request_with_retries(
+            "GET", request_url, params=mapbox_params(geocoding_query)
+        )
+    data = response.json()
+
+    coordinates = None
+    if "features" in data and data["features"]:
+        coordinates = data["features"][0]["geometry"]["coordinates"]
+
+    cache.set(search_text, coordinates)
+    return coordinates
+
+
+def direct_geocoding_query(listing_details: ListingDetails) -> Optional[GeocodingQuery]:
+    """Build a query without the LLM when the address is already a street address."""
+    address = (listing_details.address or "").strip()
+    if not _STREET_ADDRESS.match(address):
+        return None
+
+    search_text = address
+    if "," not in address and listing_details.location:
+        search_text = f"{address}, {listing_details.location}"
+
+    return GeocodingQuery(
+        search_text=search_text,
+        country=["us"],
+        types=["address"],
+        limit=1,
+        autocomplete=False,
+    )
+
+
+def _geocoding_prompt(listing_details: ListingDetails) -> str:
+    return geocoding_prompt.format(
+        title=listing_details.title,
+        location=listing_details.location,
+        address=listing_details.address or "Not provided",
+        description=listing_details.description,
+    )
+
+
+class GeocodingQueryBatcher:
+    """Turns concurrent geocode() calls into one structured LLM call.
+
+    Calls arriving within ``window`` seconds of each other (or until
+    ``max_size`` are queued) share a single request that returns one
+    GeocodingQuery per listing. Listings the LLM cache already has an answer
+    for never join a batch.
+    """
+
+    def __init__(
+        self,
+        llm,
+        window: float = GEOCODE_BATCH_WINDOW_SECONDS,
+        max_size: int = GEOCODE_BATCH_MAX_SIZE,
+    ):
+        self._llm = llm
+        self._window = window
+        self._max_size = max_size
+        self._pending: List[Tuple[ListingDetails, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    async def query(self, listing_details: ListingDetails) -> GeocodingQuery:
+        direct = direct_geocoding_query(listing_details)
+        if direct is not None:
+            return direct
+
+        # Keyed on the single-listing prompt so a repeat hits whichever batch
+        # it lands in.
+        cache = get_llm_cache()
+        key = cache.key(
+            model_name(self._llm), GeocodingQuery, _geocoding_prompt(listing_details)
+        )
+        cached = cache.get(key, GeocodingQuery, "geocode")
+        if cached is not LLM_CACHE_MISS:
+            return cached
+
+        query = await self._enqueue(listing_details)
+        cache.set(key, GeocodingQuery, query, "geocode")
+        return query
+
+    async def _enqueue(self, listing_details: ListingDetails) -> GeocodingQuery:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((listing_details, future))
+
+        if len(self._pending) >= self._max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self._window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        # Callers cancelled while waiting for the window don't need a query
+        batch = [(details, future) for details, future in self._pending if not future.done()]
+        self._pending = []
+        if not batch:
+            return
+
+        task = asyncio.create_task(self._run(batch))
+
+        def abandon(_):
+            if all(future.cancelled() for _, future in batch):
+                task.cancel()
+
+        for _, future in batch:
+            future.add_done_callback(abandon)
+
+    @timed("geocode.query_llm")
+    async def _run(self, batch: List[Tuple[ListingDetails, asyncio.Future]]):
+        started = time.perf_counter()
+        try:
+            if len(batch) == 1:
+                listing_details, future = batch[0]
+                query = await self._llm.with_structured_output(GeocodingQuery).ainvoke(
+                    _geocoding_prompt(listing_details)
+                )
+                get_llm_cache().record_call("geocode", time.perf_counter() - started)
+                if not future.done():
+                    future.set_result(query)
+                return
+
+            listings = "\n\n".join(
+                batch_geocoding_listing_template.format(
+                    index=index,
+                    title=listing_details.title,
+                    location=listing_details.location,
+                    address=listing_details.address or "Not provided",
+                    description=listing_details.description[
+                        :GEOCODE_BATCH_DESCRIPTION_CHARS
+                    ],
+                )
+                for index, (listing_details, _) in enumerate(batch)
+            )
+            result = await self._llm.with_structured_output(GeocodingQueries).ainvoke(
+                batch_geocoding_prompt.format(listings=listings)
+            )
+            get_llm_cache().record_call("geocode", time.perf_counter() - started)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        queries = {query.listing_index: query for query in result.queries}
+        for index, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            query = queries.get(index)
+            if query is None:
+                future.set_exception(
+                    LookupError(f"no geocoding query for listing {index}")
+                )
+            else:
+                future.set_result(
+                    GeocodingQuery(**query.model_dump(exclude={"listing_index"}))
+                )
@@ -1,11 +1,14 @@
-import asyncio
 import os
-import requests
+from contextlib import aclosing
+from functools import lru_cache
 from typing import List
+
+from langchain_core.runnables import RunnableConfig
 from langchain_openai import ChatOpenAI
 from langchain_anthropic import ChatAnthropic
 from langgraph.graph import StateGraph, END
-from browser_use import Agent, Browser, BrowserConfig, BrowserContextConfig, Controller, ActionResult
+from langgraph.types import StreamWriter
+from browser_use import Browser, Controller, ActionResult
 
 from prompts import (
     parse_preferences_instructions,
@@ -15,7 +18,6 @@ from prompts import (
     bathroom_filter_template,
     search_results_collection_instructions,
     listing_analysis_instructions,
-    geocoding_prompt,
 )
 from models import (
     ApartmentFinderState,
@@ -23,283 +25,430 @@ from models import (
     SearchUrl,
     SearchResults,
     ListingDetails,
-    GeocodingQuery,
     GeocodedResult,
 )
+from search_url import build_search_url
+from http_client import GONE_STATUS_CODES, PageGone, fetch_html, fetch_with_status
+from llm_cache import cached_structured_output
+from geocoding import MAPBOX_ACCESS_TOKEN, GeocodingQueryBatcher, mapbox_geocode
+from browser_pool import get_browser_pool
+from rate_limit import RateLimitCallbackHandler
+from metrics import UsageCallbackHandler, run_agent, timed
+from scheduler import MAX_LISTING_CONCURRENCY, schedule
+from pagination import harvest_listings
+from parsers import listing_post_id, parse_listing_page, parse_search_results
+from listing_cache import get_listing_cache
+from listings_store import get_listings_store
+from dedup import DuplicateListing, ListingDeduplicator
+from extraction_mode import ExtractionAgent
+from requirements_parser import REQUIREMENTS_CONFIDENCE_THRESHOLD, parse_requirements
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
-MAPBOX_ACCESS_TOKEN = os.environ.get("MAPBOX_ACCESS_TOKEN")
+
+GRAPH_CACHE_SIZE = int(os.environ.get("GRAPH_CACHE_SIZE", "8"))
+# Model names come from clients, so the client cache has to be bounded
+CHAT_MODEL_CACHE_SIZE = int(os.environ.get("CHAT_MODEL_CACHE_SIZE", "8"))
+DEFAULT_MAX_LISTINGS = 10
+# A run gives up once it has tried this many candidates per listing wanted,
+# or after this many failures in a row (throttling, 403s...).
+LISTING_ATTEMPTS_PER_RESULT = int(os.environ.get("LISTING_ATTEMPTS_PER_RESULT", "3"))
+LISTING_MAX_CONSECUTIVE_FAILURES = int(
+    os.environ.get("LISTING_MAX_CONSECUTIVE_FAILURES", "5")
+)
+DEFAULT_EXTRACTION_MODE = "vision"
+
+
+@lru_cache(maxsize=CHAT_MODEL_CACHE_SIZE)
+def get_chat_model(model: str):
+    """One client per model so its HTTP connection pool is shared."""
+    if model == "claude-3-5-sonnet-latest":
+        return ChatAnthropic(
+            model=model,
+            callbacks=[
+                RateLimitCallbackHandler("api.anthropic.com"),
+                UsageCallbackHandler(model),
+            ],
+        )
+    return ChatOpenAI(
+        model=model,
+        callbacks=[
+            RateLimitCallbackHandler("api.openai.com"),
+            UsageCallbackHandler(model),
+        ],
+    )
+
+
+def _configurable(config: RunnableConfig, key: str, default):
+    value = (config or {}).get("configurable", {}).get(key)
+    return default if value is None else value
+
+
+async def resolve_requirements(description: str, llm) -> Requirements:
+    """Rule-based parse first, the LLM only when the rules aren't confident."""
+    parsed = parse_requirements(description)
+    if parsed.confidence >= REQUIREMENTS_CONFIDENCE_THRESHOLD:
+        return parsed.requirements
+
+    return await cached_structured_output(
+        llm,
+        Requirements,
+        parse_preferences_instructions.format(description=description),
+        "requirements",
+    )
 
 
 def apartment_finder_graph(
     executor_model="gpt-4o-mini",
     planner_model="gpt-4o",
     headless_mode=True,
-    max_listings=10,
 ):
-    if executor_model == "claude-3-5-sonnet-latest":
-        llm = ChatAnthropic(model=executor_model)
-    else:
-        llm = ChatOpenAI(model=executor_model)
-
-    if planner_model == "claude-3-5-sonnet-latest":
-        planner_llm = ChatAnthropic(model=planner_model)
-    else:
-        planner_llm = ChatOpenAI(model=planner_model)
+    """Build the search graph for one model/browser configuration.
 
-    browser_config = BrowserConfig(headless=headless_mode)
+    Per-run settings are read from ``config["configurable"]``:
+    ``max_listings``, ``search_agent_fallback``, ``max_concurrency`` and
+    ``extraction_mode``.
+    """
+    llm = get_chat_model(executor_model)
+    planner_llm = get_chat_model(planner_model)
 
-    _max_listings = max_listings
+    browser_pool = get_browser_pool(headless_mode)
+    geocoding_query_batcher = GeocodingQueryBatcher(llm)
 
     graph = StateGraph(ApartmentFinderState)
-    browser_context_config = BrowserContextConfig(allowed_domains=["craigslist.org"])
 
     async def gather_requirements(
         state: ApartmentFinderState,
     ) -> ApartmentFinderState:
-        description = state["user_description"]
-        structured_llm = llm.with_structured_output(Requirements)
-
-        requirements = await structured_llm.ainvoke(
-            parse_preferences_instructions.format(description=description)
-        )
+        requirements = await resolve_requirements(state["user_description"], llm)
 
         return {
             **state,
             "requirements": requirements,
         }
 
-    async def browse_craigslist(
-        state: ApartmentFinderState,
-    ) -> ApartmentFinderState:
-        browser = None
-        try:
-            browser = Browser(config=browser_config)
-            requirements = state["requirements"]
-            location = requirements["location"]
-
-            filter_parts = []
-
-            if (
-                requirements["min_price"] is not None
-                or requirements["max_price"] is not None
-            ):
-                filter_parts.append(
-                    price_filter_template.format(
-                        min_price=requirements["min_price"] or "",
-                        max_price=requirements["max_price"] or "",
-                    )
+    async def navigate_to_search_url(
+        browser, context, requirements, extraction_mode
+    ) -> SearchUrl:
+        location = requirements["location"]
+        filter_parts = []
+
+        if (
+            requirements["min_price"] is not None
+            or requirements["max_price"] is not None
+        ):
+            filter_parts.append(
+                price_filter_template.format(
+                    min_price=requirements["min_price"] or "",
+                    max_price=requirements["max_price"] or "",
                 )
+            )
 
-            if (
-                requirements["min_bedrooms"] is not None
-                or requirements["max_bedrooms"] is not None
-            ):
-                filter_parts.append(
-                    bedroom_filter_template.format(
-                        min_bedrooms=requirements["min_bedrooms"] or "",
-                        max_bedrooms=requirements["max_bedrooms"] or "",
-                    )
+        if (
+            requirements["min_bedrooms"] is not None
+            or requirements["max_bedrooms"] is not None
+        ):
+            filter_parts.append(
+                bedroom_filter_template.format(
+                    min_bedrooms=requirements["min_bedrooms"] or "",
+                    max_bedrooms=requirements["max_bedrooms"] or "",
                 )
+            )
 
-            if (
-                requirements["min_bathrooms"] is not None
-                or requirements["max_bathrooms"] is not None
-            ):
-                filter_parts.append(
-                    bathroom_filter_template.format(
-                        min_bathrooms=requirements["min_bathrooms"] or "",
-                        max_bathrooms=requirements["max_bathrooms"] or "",
-                    )
+        if (
+            requirements["min_bathrooms"] is not None
+            or requirements["max_bathrooms"] is not None
+        ):
+            filter_parts.append(
+                bathroom_filter_template.format(
+                    min_bathrooms=requirements["min_bathrooms"] or "",
+                    max_bathrooms=requirements["max_bathrooms"] or "",
                 )
+            )
 
-            filter_instructions = "\n".join(filter_parts)
-
-            async with await browser.new_context(config=browser_context_config) as context:
-                search_controller = Controller(output_model=SearchUrl)
-
-                @search_controller.action("Get current URL")
-                async def get_current_url(browser: Browser):
-                    page = browser.get_current_page()
-                    await page.reload()
-                    await page.wait_for_load_state("networkidle")
-                    current_url = await page.evaluate("window.location.href")
-                    return ActionResult(extracted_content=current_url)
-
-                search_agent = Agent(
-                    task=craigslist_navigation_instructions.format(
-                        location=location, filter_instructions=filter_instructions
-                    ),
-                    llm=llm,
-                    planner_llm=planner_llm,
-                    use_vision_for_planner=True,
-                    controller=search_controller,
-                    use_vision=True,
-                    planner_interval=2,
-                    initial_actions=[
-                        {"go_to_url": {"url": "https://geo.craigslist.org/iso/us"}}
-                    ],
-                    browser=browser,
-                    browser_context=context,
-                )
+        filter_instructions = "\n".join(filter_parts)
+
+        search_controller = Controller(output_model=SearchUrl)
+
+        @search_controller.action("Get current URL")
+        async def get_current_url(browser: Browser):
+            page = browser.get_current_page()
+            await page.reload()
+            await page.wait_for_load_state("networkidle")
+            current_url = await page.evaluate("window.location.href")
+            return ActionResult(extracted_content=current_url)
+
+        search_agent = ExtractionAgent(
+            task=craigslist_navigation_instructions.format(
+                location=location, filter_instructions=filter_instructions
+            ),
+            llm=llm,
+            planner_llm=planner_llm,
+            use_vision_for_planner=True,
+            controller=search_controller,
+            use_vision=True,
+            extraction_mode=extraction_mode,
+            planner_interval=2,
+            initial_actions=[
+                {"go_to_url": {"url": "https://geo.craigslist.org/iso/us"}}
+            ],
+            browser=browser,
+            browser_context=context,
+        )
 
-                history = await search_agent.run()
-                search_url_result = history.final_result()
-                search_url = SearchUrl.model_validate_json(search_url_result)
+        history = await run_agent("navigate", search_agent)
+        return SearchUrl.model_validate_json(history.final_result())
+
+    async def extract_search_results_with_agent(
+        browser, context, search_url: SearchUrl, extraction_mode
+    ) -> SearchResults:
+        extract_search_results_controller = Controller(output_model=SearchResults)
+        extract_search_results_agent = ExtractionAgent(
+            task=search_results_collection_instructions,
+            llm=llm,
+            planner_llm=planner_llm,
+            use_vision_for_planner=True,
+            controller=extract_search_results_controller,
+            use_vision=True,
+            extraction_mode=extraction_mode,
+            planner_interval=2,
+            browser_context=context,
+            browser=browser,
+            initial_actions=[{"go_to_url": {"url": search_url.url}}],
+        )
 
-                extract_search_results_controller = Controller(
-                    output_model=SearchResults
-                )
-                extract_search_results_agent = Agent(
-                    task=search_results_collection_instructions,
-                    llm=llm,
-                    planner_llm=planner_llm,
-                    use_vision_for_planner=True,
-                    controller=extract_search_results_controller,
-                    use_vision=True,
-                    planner_interval=2,
-                    browser_context=context,
-                    browser=browser,
-                    initial_actions=[{"go_to_url": {"url": search_url.url}}],
-                )
+        history = await run_agent(
+            "search_results", extract_search_results_agent, max_steps=10
+        )
+        return SearchResults.model_validate_json(history.final_result())
 
-                history = await extract_search_results_agent.run(max_steps=10)
-                search_results = SearchResults.model_validate_json(
-                    history.final_result()
-                )
+    async def fetch_search_results(search_url: SearchUrl) -> SearchResults:
+        html = await fetch_html(search_url.url)
+        if not html:
+            return SearchResults()
+        return SearchResults(listings=parse_search_results(html, search_url.url))
+
+    async def browse_craigslist(
+        state: ApartmentFinderState, config: RunnableConfig
+    ) -> ApartmentFinderState:
+        requirements = state["requirements"]
+        search_agent_fallback = _configurable(config, "search_agent_fallback", False)
+        extraction_mode = _configurable(config, "extraction_mode", DEFAULT_EXTRACTION_MODE)
+
+        search_url = None
+        search_results = SearchResults()
+
+        url = build_search_url(requirements)
+        if url:
+            search_url = SearchUrl(url=url)
+            search_results = await fetch_search_results(search_url)
+
+        if search_url is None or (
+            not search_results.listings and search_agent_fallback
+        ):
+            async with browser_pool.context() as (browser, context):
+                if search_url is None:
+                    search_url = await navigate_to_search_url(
+                        browser, context, requirements, extraction_mode
+                    )
+                    search_results = await fetch_search_results(search_url)
+
+                if not search_results.listings and search_agent_fallback:
+                    search_results = await extract_search_results_with_agent(
+                        browser, context, search_url, extraction_mode
+                    )
+
+        return {
+            **state,
+            "search_url": search_url,
+            "search_results": search_results,
+        }
+
+    async def extract_listing_details_with_agent(
+        listing_url, extraction_mode
+    ) -> ListingDetails:
+        async with browser_pool.context() as (browser, context):
+            extract_listing_details_controller = Controller(output_model=ListingDetails)
+            extract_listing_details_agent = ExtractionAgent(
+                controller=extract_listing_details_controller,
+                browser_context=context,
+                browser=browser,
+                task=listing_analysis_instructions,
+                llm=llm,
+                use_vision=True,
+                extraction_mode=extraction_mode,
+                initial_actions=[{"go_to_url": {"url": listing_url.url}}],
+            )
 
-            return {
-                **state,
-                "search_results": search_results,
-            }
-        finally:
-            if browser:
-                await browser.close()
+            history = await run_agent(
+                "listing_details", extract_listing_details_agent, max_steps=10
+            )
+            return ListingDetails.model_validate_json(history.final_result())
 
     async def collect_listing_details(
-        state: ApartmentFinderState,
+        state: ApartmentFinderState, config: RunnableConfig, writer: StreamWriter
     ) -> ApartmentFinderState:
-        browser = None
-        try:
-            browser = Browser(config=browser_config)
-
-            search_results = state["search_results"]
-            geocoded_listings = []
-
-            async def process_listing(listing_url):
-                listing_browser = None
-                try:
-                    listing_browser = Browser(config=browser_config)
-                    async with await listing_browser.new_context(config=browser_context_config) as context:
-                        extract_listing_details_controller = Controller(
-                            output_model=ListingDetails
-                        )
-                        extract_listing_details_agent = Agent(
-                            controller=extract_listing_details_controller,
-                            browser_context=context,
-                            browser=listing_browser,
-                            task=listing_analysis_instructions,
-                            llm=llm,
-                            use_vision=True,
-                            initial_actions=[{"go_to_url": {"url": listing_url.url}}],
-                        )
-
-                        history = await extract_listing_details_agent.run(max_steps=10)
-                        result_data = history.final_result()
-                        listing_details = ListingDetails.model_validate_json(
-                            result_data
-                        )
-
-                        coordinates = await geocode(listing_details)
-
-                        return GeocodedResult(
-                            listing_details=listing_details,
-                            coordinates=coordinates,
-                        )
-                finally:
-                    if listing_browser:
-                        await listing_browser.close()
-
-            truncated_results = SearchResults(
-                listings=search_results.listings[:_max_listings]
+        search_results = state["search_results"]
+        max_listings = _configurable(config, "max_listings", DEFAULT_MAX_LISTINGS)
+        max_concurrency = _configurable(
+            config, "max_concurrency", MAX_LISTING_CONCURRENCY
+        )
+        extraction_mode = _configurable(config, "extraction_mode", DEFAULT_EXTRACTION_MODE)
+        listing_cache = get_listing_cache()
+        listings_store = get_listings_store()
+        deduplicator = ListingDeduplicator()
+
+        async def process_listing(listing_url):
+            post_id = listing_post_id(listing_url)
+            listing_details = None
+            coordinates = None
+            updated_at = None
+
+            status_code, html = await fetch_with_status(listing_url.url)
+            if status_code in GONE_STATUS_CODES:
+                # Deleted or expired posting: the agent would find nothing either
+                raise PageGone(listing_url.url, status_code)
+            if html:
+                page = parse_listing_page(html, listing_url.url)
+                updated_at = page.updated_at or page.posted_at
+
+                cached_result = listing_cache.revalidate(post_id, updated_at)
+                if cached_result is not None:
+                    deduplicator.check_details(post_id, cached_result.listing_details)
+                    return cached_result
+
+                listing_details = page.details
+                coordinates = page.coordinates
+
+            if listing_details is None:
+                listing_details = await extract_listing_details_with_agent(
+                    listing_url, extraction_mode
+                )
+
+            deduplicator.check_details(post_id, listing_details)
+
+            if not coordinates:
+                coordinates = await geocode(listing_details)
+
+            result = GeocodedResult(
+                listing_details=listing_details,
+                coordinates=coordinates,
+            )
+            listing_cache.set(post_id, result, updated_at)
+            return result
+
+        async def fetch_page(url):
+            return (await fetch_search_results(SearchUrl(url=url))).listings
+
+        async def process_candidate(listing_url):
+            post_id = listing_post_id(listing_url)
+            deduplicator.check_card(listing_url)
+
+            cached_result = listing_cache.lookup(post_id)
+            if cached_result is not None:
+                deduplicator.check_details(post_id, cached_result.listing_details)
+                return cached_result
+            return await process_listing(listing_url)
+
+        candidates = search_results.listings
+        if state.get("search_url") is not None:
+            candidates = harvest_listings(
+                state["search_url"].url, search_results.listings, fetch_page
+            )
+
+        # Keep pulling candidates (and result pages) until enough listings
+        # have made it through extraction, then stop.
+        results = []
+        attempted = []
+        consecutive_failures = 0
+        async with aclosing(
+            schedule(
+                candidates,
+                process_candidate,
+                max_concurrency,
+                limit=max_listings * LISTING_ATTEMPTS_PER_RESULT,
             )
-            tasks = [
-                process_listing(listing_url)
-                for listing_url in truncated_results.listings
-            ]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-
-            geocoded_listings = [r for r in results if not isinstance(r, Exception)]
-
-            return {
-                **state,
-                "geocoded_listings": geocoded_listings,
-            }
-        finally:
-            if browser:
-                await browser.close()
+        ) as scheduled:
+            async for rank, listing_url, result in scheduled:
+                attempted.append(listing_post_id(listing_url))
+                if isinstance(result, (DuplicateListing, PageGone)):
+                    continue
+                if isinstance(result, Exception):
+                    consecutive_failures += 1
+                    if consecutive_failures >= LISTING_MAX_CONSECUTIVE_FAILURES:
+                        break
+                    continue
+                consecutive_failures = 0
+                results.append((rank, result))
+                listings_store.record(listing_post_id(listing_url), result)
+                writer({"listing": result})
+                if len(results) >= max_listings:
+                    break
+
+        geocoded_listings = [result for _, result in sorted(results, key=lambda r: r[0])]
+
+        return {
+            **state,
+            "geocoded_listings": geocoded_listings,
+            "merged_post_ids": dict(deduplicator.merged),
+            "attempted_post_ids": [post_id for post_id in attempted if post_id],
+        }
 
+    @timed("geocode")
     async def geocode(listing_details: ListingDetails) -> List[float]:
         default_coords = [0.0, 0.0]
 
         if not MAPBOX_ACCESS_TOKEN:
             return default_coords
 
+        coordinates = None
         try:
-            geocoding_query = await llm.with_structured_output(
-                GeocodingQuery
-            ).ainvoke(
-                geocoding_prompt.format(
-                    title=listing_details.title,
-                    location=listing_details.location,
-                    address=listing_details.address or "Not provided",
-                    description=listing_details.description,
-                ),
-            )
-
-            base_url = "https://api.mapbox.com/geocoding/v5/mapbox.places"
-            query = requests.utils.quote(geocoding_query.search_text)
-            request_url = f"{base_url}/{query}.json"
-            params = {"access_token": MAPBOX_ACCESS_TOKEN, "limit": 1}
+            geocoding_query = await geocoding_query_batcher.query(listing_details)
 
-            response = requests.get(request_url, params=params)
-            response.raise_for_status()
-            data = response.json()
-
-            if "features" in data and data["features"]:
-                return data["features"][0]["geometry"]["coordinates"]
+            coordinates = await mapbox_geocode(
+                geocoding_query.search_text, geocoding_query
+            )
 
         except Exception:
             try:
-                fallback_query = listing_details.location
-                if fallback_query:
-                    base_url = "https://api.mapbox.com/geocoding/v5/mapbox.places"
-                    query = requests.utils.quote(fallback_query)
-                    request_url = f"{base_url}/{query}.json"
-                    params = {"access_token": MAPBOX_ACCESS_TOKEN, "limit": 1}
-
-                    response = requests.get(request_url, params=params)
-                    response.raise_for_status()
-                    data = response.json()
-
-                    if "features" in data and data["features"]:
-                        return data["features"][0]["geometry"]["coordinates"]
+                coordinates = await mapbox_geocode(listing_details.location)
             except Exception:
                 pass
 
-        return default_coords
-
-    graph.add_node("extract_requirements", gather_requirements)
-    graph.add_node("search_craigslist", browse_craigslist)
-    graph.add_node("extract_listing_details", collect_listing_details)
-
-    graph.set_entry_point("extract_requirements")
+        return coordinates or default_coords
+
+    graph.add_node(
+        "extract_requirements", timed("node.extract_requirements")(gather_requirements)
+    )
+    graph.add_node(
+        "search_craigslist", timed("node.search_craigslist")(browse_craigslist)
+    )
+    graph.add_node(
+        "extract_listing_details",
+        timed("node.extract_listing_details")(collect_listing_details),
+    )
+
+    def route_start(state: ApartmentFinderState) -> str:
+        # Saved-search polls arrive with the new cards already known, and
+        # coalesced searches with their requirements already resolved.
+        if state.get("search_results") is not None:
+            return "extract_listing_details"
+        if state.get("requirements") is not None:
+            return "search_craigslist"
+        return "extract_requirements"
+
+    graph.set_conditional_entry_point(
+        route_start,
+        ["extract_requirements", "search_craigslist", "extract_listing_details"],
+    )
 
     graph.add_edge("extract_requirements", "search_craigslist")
     graph.add_edge("search_craigslist", "extract_listing_details")
     graph.add_edge("extract_listing_details", END)
 
     return graph.compile()
+
+
+get_apartment_finder_graph = lru_cache(maxsize=GRAPH_CACHE_SIZE)(apartment_finder_graph)
@@ -0,0 +1,94 @@
+import asyncio
+import os
+from typing import Optional, Tuple
+
+import httpx
+
+from metrics import span
+from rate_limit import rate_limiter
+
+USER_AGENT = (
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+)
+
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_TIMEOUT_SECONDS = float(os.environ.get("HTTP_TIMEOUT_SECONDS", "10"))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", "2"))
+HTTP_RETRY_BACKOFF_SECONDS = 0.25
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+GONE_STATUS_CODES = {404, 410}
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT},
+            timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=5.0),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            ),
+            follow_redirects=True,
+        )
+    return _client
+
+
+async def request_with_retries(
+    method: str, url: str, retries: int = HTTP_RETRIES, **kwargs
+) -> httpx.Response:
+    """Send a request on the shared client, retrying transport errors and
+    throttling/5xx responses with exponential backoff. Raises httpx.HTTPError
+    once retries are exhausted."""
+    attempt = 0
+    while True:
+        await rate_limiter.acquire(url)
+        try:
+            response = await get_http_client().request(method, url, **kwargs)
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= retries:
+                response.raise_for_status()
+                return response
+        except httpx.TransportError:
+            if attempt >= retries:
+                raise
+
+        await asyncio.sleep(HTTP_RETRY_BACKOFF_SECONDS * 2**attempt)
+        attempt += 1
+
+
+class PageGone(Exception):
+    """The page was deleted or has expired (the server answered 404/410)."""
+
+    def __init__(self, url: str, status_code: int):
+        super().__init__(f"{url} returned {status_code}")
+        self.url = url
+        self.status_code = status_code
+
+
+async def fetch_with_status(url: str) -> Tuple[Optional[int], Optional[str]]:
+    """Fetch ``url`` and return (status code, body). The body is None unless
+    the request succeeded; the status is None if no response came back."""
+    try:
+        with span("http.fetch"):
+            response = await request_with_retries("GET", url)
+        return response.status_code, response.text
+    except httpx.HTTPStatusError as error:
+        return error.response.status_code, None
+    except httpx.HTTPError:
+        return None, None
+
+
+async def fetch_html(url: str) -> Optional[str]:
+    return (await fetch_with_status(url))[1]
+
+
+async def close_http_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
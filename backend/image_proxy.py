@@ -0,0 +1,251 @@
+import asyncio
+import hashlib
+import io
+import os
+import re
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional, Tuple
+
+import httpx
+from PIL import Image
+
+from http_client import request_with_retries
+from metrics import span
+from models import GeocodedResult
+from parsers import IMAGE_URL_TEMPLATE, parse_image_id
+from storage import connect, data_path
+
+# Where clients reach the API; listing payloads point their images here.
+IMAGE_PROXY_BASE_URL = os.environ.get("IMAGE_PROXY_BASE_URL", "http://localhost:8000")
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+IMAGE_JPEG_QUALITY = int(os.environ.get("IMAGE_JPEG_QUALITY", "80"))
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Bounding boxes; images are scaled down to fit, never up
+IMAGE_VARIANTS: Dict[str, Tuple[int, int]] = {
+    "thumb": (300, 225),
+    "full": (1200, 900),
+}
+
+_IMAGE_KEY = re.compile(r"^[0-9A-Za-z]{5}_[0-9A-Za-z]+_[0-9A-Za-z]+$")
+
+
+def proxy_image_url(url: str) -> str:
+    """The proxy URL for a Craigslist image, or ``url`` unchanged."""
+    image_id = parse_image_id(url)
+    if image_id is None:
+        return url
+    return f"{IMAGE_PROXY_BASE_URL}/api/images/{image_id}"
+
+
+def proxied_listing(result: GeocodedResult) -> dict:
+    """``result.model_dump()`` with its images pointed at the proxy."""
+    data = result.model_dump()
+    details = data["listing_details"]
+    details["images"] = [proxy_image_url(url) for url in details["images"]]
+    return data
+
+
+def is_image_key(key: str) -> bool:
+    return bool(_IMAGE_KEY.match(key))
+
+
+def render_variants(original: bytes) -> Dict[str, bytes]:
+    variants = {}
+    with Image.open(io.BytesIO(original)) as image:
+        image = image.convert("RGB")
+        for name, size in IMAGE_VARIANTS.items():
+            resized = image.copy()
+            resized.thumbnail(size)
+            output = io.BytesIO()
+            resized.save(
+                output, "JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True, progressive=True
+            )
+            variants[name] = output.getvalue()
+    return variants
+
+
+@dataclass
+class CachedImage:
+    path: str
+    etag: str
+
+
+@dataclass
+class ImageCacheStats:
+    hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    fetches: int = 0
+    fetch_errors: int = 0
+    evictions: int = 0
+
+
+class ImageCache:
+    """Resized Craigslist photos on disk, evicted least recently used first.
+
+    Files live under DATA_DIR/images, one per variant; a SQLite table tracks
+    size, ETag and last access so the total stays under ``max_bytes``.
+    Craigslist image IDs never change content, so entries have no TTL.
+    """
+
+    def __init__(
+        self,
+        filename: str = "image_cache.sqlite3",
+        directory: str = "images",
+        max_bytes: int = IMAGE_CACHE_MAX_BYTES,
+    ):
+        self.max_bytes = max_bytes
+        self.stats = ImageCacheStats()
+        self._directory = data_path(directory)
+        os.makedirs(self._directory, exist_ok=True)
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self._db = connect(filename)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS image_cache ("
+            " key TEXT NOT NULL,"
+            " variant TEXT NOT NULL,"
+            " bytes INTEGER NOT NULL,"
+            " etag TEXT NOT NULL,"
+            " accessed_at REAL NOT NULL,"
+            " PRIMARY KEY (key, variant))"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS image_cache_accessed_at"
+            " ON image_cache (accessed_at)"
+        )
+
+    def _path(self, key: str, variant: str) -> str:
+        return os.path.join(self._directory, f"{key}_{variant}.jpg")
+
+    def get(self, key: str, variant: str) -> Optional[CachedImage]:
+        path = self._path(key, variant)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT etag FROM image_cache WHERE key = ? AND variant = ?",
+                (key, variant),
+            ).fetchone()
+            if row is None or not os.path.exists(path):
+                return None
+            self._db.execute(
+                "UPDATE image_cache SET accessed_at = ? WHERE key = ? AND variant = ?",
+                (time.time(), key, variant),
+            )
+        return CachedImage(path=path, etag=row[0])
+
+    async def image(self, key: str, variant: str) -> CachedImage:
+        """Serve ``variant`` of image ``key``, fetching and resizing it on a
+        miss. Concurrent misses for the same key share one fetch."""
+        cached = self.get(key, variant)
+        if cached is not None:
+            self.stats.hits += 1
+            return cached
+
+        self.stats.misses += 1
+        task = self._inflight.get(key)
+        if task is None:
+            # The fetch runs in its own task so a client that disconnects
+            # doesn't fail the others waiting on the same image.
+            task = asyncio.create_task(self._fetch(key))
+            self._inflight[key] = task
+
+            def finished(task: asyncio.Task):
+                self._inflight.pop(key, None)
+                if not task.cancelled():
+                    task.exception()
+
+            task.add_done_callback(finished)
+        else:
+            self.stats.coalesced += 1
+        await asyncio.shield(task)
+
+        cached = self.get(key, variant)
+        if cached is None:
+            raise LookupError(f"image {key} was evicted before it was served")
+        return cached
+
+    async def _fetch(self, key: str):
+        self.stats.fetches += 1
+        try:
+            with span("image.fetch"):
+                response = await request_with_retries(
+                    "GET", IMAGE_URL_TEMPLATE.format(image_id=key)
+                )
+        except httpx.HTTPError:
+            self.stats.fetch_errors += 1
+            raise
+
+        with span("image.resize"):
+            variants = await asyncio.to_thread(render_variants, response.content)
+        for variant, data in variants.items():
+            self._put(key, variant, data)
+        self._evict(keep=key)
+
+    def _put(self, key: str, variant: str, data: bytes):
+        path = self._path(key, variant)
+        temporary = f"{path}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+
+        etag = '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO image_cache (key, variant, bytes, etag, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (key, variant, len(data), etag, time.time()),
+            )
+
+    def _evict(self, keep: str):
+        # ``keep`` was just fetched for a waiting request; never evict it
+        with self._lock:
+            total = self._db.execute(
+                "SELECT COALESCE(SUM(bytes), 0) FROM image_cache"
+            ).fetchone()[0]
+            if total <= self.max_bytes:
+                return
+
+            rows = self._db.execute(
+                "SELECT key, variant, bytes FROM image_cache WHERE key != ?"
+                " ORDER BY accessed_at",
+                (keep,),
+            ).fetchall()
+            for key, variant, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self._db.execute(
+                    "DELETE FROM image_cache WHERE key = ? AND variant = ?", (key, variant)
+                )
+                try:
+                    os.remove(self._path(key, variant))
+                except FileNotFoundError:
+                    pass
+                total -= size
+                self.stats.evictions += 1
+
+    def stats_dict(self) -> dict:
+        with self._lock:
+            entries, total = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM image_cache"
+            ).fetchone()
+        lookups = self.stats.hits + self.stats.misses
+        return {
+            **asdict(self.stats),
+            "hit_ratio": self.stats.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+        }
+
+
+_cache: Optional[ImageCache] = None
+
+
+def get_image_cache() -> ImageCache:
+    global _cache
+    if _cache is None:
+        _cache = ImageCache()
+    return _cache
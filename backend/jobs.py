@@ -0,0 +1,173 @@
+import json
+import os
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import List, Optional, Tuple
+
+from storage import EventLog, connect, fetch_returning
+
+# A running job whose worker hasn't checked in for this long is assumed dead
+# and handed to the next worker that asks for work.
+JOB_STALE_SECONDS = float(os.environ.get("JOB_STALE_SECONDS", "60"))
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", "0.5"))
+
+QUEUED = "queued"
+RUNNING = "running"
+CANCELLING = "cancelling"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+TERMINAL_STATUSES = {COMPLETED, FAILED, CANCELLED}
+
+
+@dataclass
+class Job:
+    id: str
+    request: dict
+    status: str
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    worker: Optional[str] = None
+    attempts: int = 0
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+_JOB_COLUMNS = (
+    "id, request, status, created_at, started_at, finished_at, worker, attempts, error"
+)
+
+
+def _job(row) -> Job:
+    return Job(row[0], json.loads(row[1]), *row[2:])
+
+
+class JobStore:
+    """Search jobs and the events they produced, in SQLite.
+
+    The API process enqueues jobs and tails their events; worker processes
+    claim jobs and append events. Events are stored as the JSON the SSE
+    stream sends, numbered per job so a client can resume after the last
+    one it saw.
+    """
+
+    def __init__(self, filename: str = "jobs.sqlite3"):
+        self._lock = threading.Lock()
+        self._db = connect(filename)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " request TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL,"
+            " worker TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " error TEXT,"
+            " heartbeat_at REAL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)"
+        )
+        self._events = EventLog(self._db, self._lock, "job_events", "job_id")
+
+    def create(self, request: dict) -> Job:
+        job = Job(id=uuid.uuid4().hex, request=request, status=QUEUED, created_at=time.time())
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, request, status, created_at) VALUES (?, ?, ?, ?)",
+                (job.id, json.dumps(request), job.status, job.created_at),
+            )
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return _job(row) if row else None
+
+    def claim(self, worker: str) -> Optional[Job]:
+        """Atomically take the oldest queued (or abandoned) job."""
+        now = time.time()
+        with self._lock:
+            # Nobody is left to acknowledge these cancellations
+            self._db.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?"
+                " WHERE status = ? AND heartbeat_at < ?",
+                (CANCELLED, now, CANCELLING, now - JOB_STALE_SECONDS),
+            )
+            row = fetch_returning(
+                self._db,
+                "UPDATE jobs SET status = ?, worker = ?, started_at = ?,"
+                " heartbeat_at = ?, attempts = attempts + 1"
+                " WHERE id = ("
+                "  SELECT id FROM jobs"
+                "  WHERE status = ? OR (status = ? AND heartbeat_at < ?)"
+                "  ORDER BY created_at LIMIT 1)"
+                f" RETURNING {_JOB_COLUMNS}",
+                (RUNNING, worker, now, now, QUEUED, RUNNING, now - JOB_STALE_SECONDS),
+            )
+        return _job(row) if row else None
+
+    def heartbeat(self, job_id: str) -> Optional[str]:
+        """Record that the job's worker is alive and return the job status."""
+        with self._lock:
+            row = fetch_returning(
+                self._db,
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? RETURNING status",
+                (time.time(), job_id),
+            )
+        return row[0] if row else None
+
+    def requeue(self, job_id: str):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, worker = NULL WHERE id = ? AND status = ?",
+                (QUEUED, job_id, RUNNING),
+            )
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """Cancel a queued job outright, or ask a running job's worker to stop."""
+        with self._lock:
+            row = fetch_returning(
+                self._db,
+                "UPDATE jobs SET"
+                " status = CASE status WHEN ? THEN ? ELSE ? END,"
+                " finished_at = CASE status WHEN ? THEN ? ELSE finished_at END"
+                " WHERE id = ? AND status IN (?, ?)"
+                " RETURNING status",
+                (QUEUED, CANCELLED, CANCELLING, QUEUED, time.time(), job_id, QUEUED, RUNNING),
+            )
+        return row[0] if row else None
+
+    def finish(self, job_id: str, status: str, error: Optional[str] = None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, error, time.time(), job_id),
+            )
+
+    def append_event(self, job_id: str, event: dict) -> int:
+        return self._events.append(job_id, event)
+
+    def events(self, job_id: str, after: int = 0) -> List[Tuple[int, str]]:
+        """Events after sequence number ``after``, as (seq, json) pairs."""
+        return self._events.events(job_id, after)
+
+
+_store: Optional[JobStore] = None
+
+
+def get_job_store() -> JobStore:
+    global _store
+    if _store is None:
+        _store = JobStore()
+    return _store
@@ -0,0 +1,151 @@
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from models import GeocodedResult
+from storage import connect
+
+# Entries validated within the TTL are served without touching Craigslist.
+# Older entries are revalidated against the posting's "updated" timestamp
+# until they reach the max age (counted from when they were first cached),
+# after which they are dropped.
+LISTING_CACHE_TTL_SECONDS = float(os.environ.get("LISTING_CACHE_TTL_SECONDS", "21600"))
+LISTING_CACHE_MAX_AGE_SECONDS = float(
+    os.environ.get("LISTING_CACHE_MAX_AGE_SECONDS", str(7 * 24 * 3600))
+)
+
+
+@dataclass
+class CachedListing:
+    post_id: str
+    result: GeocodedResult
+    updated_at: Optional[str]
+    cached_at: float
+    validated_at: float
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.cached_at
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() - self.validated_at < LISTING_CACHE_TTL_SECONDS
+
+
+@dataclass
+class ListingCacheStats:
+    hits: int = 0
+    revalidated: int = 0
+    invalidated: int = 0
+    misses: int = 0
+    writes: int = 0
+
+
+class ListingCache:
+    def __init__(self, filename: str = "listing_cache.sqlite3"):
+        self.stats = ListingCacheStats()
+        self._lock = threading.Lock()
+        self._db = connect(filename)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS listing_cache ("
+            " post_id TEXT PRIMARY KEY,"
+            " result TEXT NOT NULL,"
+            " updated_at TEXT,"
+            " cached_at REAL NOT NULL,"
+            " validated_at REAL NOT NULL)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(listing_cache)")}
+        if "validated_at" not in columns:
+            # Tables from before validated_at was split out of cached_at
+            self._db.execute("ALTER TABLE listing_cache ADD COLUMN validated_at REAL")
+            self._db.execute("UPDATE listing_cache SET validated_at = cached_at")
+
+    def get(self, post_id: Optional[str]) -> Optional[CachedListing]:
+        if not post_id:
+            return None
+
+        with self._lock:
+            row = self._db.execute(
+                "SELECT result, updated_at, cached_at, validated_at FROM listing_cache"
+                " WHERE post_id = ?",
+                (post_id,),
+            ).fetchone()
+
+        if row is None or time.time() - row[2] >= LISTING_CACHE_MAX_AGE_SECONDS:
+            return None
+
+        return CachedListing(
+            post_id=post_id,
+            result=GeocodedResult.model_validate_json(row[0]),
+            updated_at=row[1],
+            cached_at=row[2],
+            validated_at=row[3],
+        )
+
+    def lookup(self, post_id: Optional[str]) -> Optional[GeocodedResult]:
+        """Return the cached result if it is still fresh."""
+        cached = self.get(post_id)
+        if cached is not None and cached.fresh:
+            self.stats.hits += 1
+            return cached.result
+        self.stats.misses += 1
+        return None
+
+    def revalidate(
+        self, post_id: Optional[str], updated_at: Optional[str]
+    ) -> Optional[GeocodedResult]:
+        """Reuse a stale entry if the posting hasn't been updated since."""
+        cached = self.get(post_id)
+        if cached is None:
+            return None
+
+        if updated_at and cached.updated_at == updated_at:
+            self.touch(post_id)
+            self.stats.revalidated += 1
+            return cached.result
+
+        self.invalidate(post_id)
+        self.stats.invalidated += 1
+        return None
+
+    def set(
+        self, post_id: Optional[str], result: GeocodedResult, updated_at: Optional[str]
+    ):
+        if not post_id:
+            return
+
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO listing_cache"
+                " (post_id, result, updated_at, cached_at, validated_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (post_id, result.model_dump_json(), updated_at, now, now),
+            )
+            self.stats.writes += 1
+
+    def touch(self, post_id: str):
+        with self._lock:
+            self._db.execute(
+                "UPDATE listing_cache SET validated_at = ? WHERE post_id = ?",
+                (time.time(), post_id),
+            )
+
+    def invalidate(self, post_id: str):
+        with self._lock:
+            self._db.execute("DELETE FROM listing_cache WHERE post_id = ?", (post_id,))
+
+    def stats_dict(self) -> dict:
+        return asdict(self.stats)
+
+
+_cache: Optional[ListingCache] = None
+
+
+def get_listing_cache() -> ListingCache:
+    global _cache
+    if _cache is None:
+        _cache = ListingCache()
+    return _cache
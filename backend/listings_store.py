@@ -0,0 +1,245 @@
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import List, Optional
+
+from image_proxy import proxied_listing
+from models import GeocodedResult, Requirements
+from parsers import parse_post_id, parse_price, parse_region
+from regions import get_region_index, normalize_location, resolve_region
+from storage import connect
+
+LISTINGS_QUERY_LIMIT = int(os.environ.get("LISTINGS_QUERY_LIMIT", "50"))
+
+
+@dataclass
+class StoredListing:
+    post_id: str
+    result: GeocodedResult
+    first_seen: float
+    last_seen: float
+
+    def to_dict(self) -> dict:
+        return {
+            "post_id": self.post_id,
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+            **proxied_listing(self.result),
+        }
+
+
+@dataclass
+class ListingsStoreStats:
+    writes: int = 0
+    queries: int = 0
+
+
+def _phrase(text: str) -> str:
+    return '"' + text.replace('"', '""') + '"'
+
+
+class ListingsStore:
+    """Every listing a search has produced, queryable without re-browsing.
+
+    Price, bedrooms, bathrooms, region and neighborhood are parsed out of
+    ListingDetails into indexed columns. An FTS5 index mirrors title,
+    description and location through triggers.
+    """
+
+    def __init__(self, filename: str = "listings.sqlite3"):
+        self.stats = ListingsStoreStats()
+        self._lock = threading.Lock()
+        self._db = connect(filename)
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS listings (
+                post_id TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                title TEXT NOT NULL,
+                description TEXT NOT NULL,
+                location TEXT NOT NULL,
+                region TEXT,
+                neighborhood TEXT,
+                price INTEGER,
+                bedrooms INTEGER,
+                bathrooms REAL,
+                longitude REAL,
+                latitude REAL,
+                result TEXT NOT NULL,
+                first_seen REAL NOT NULL,
+                last_seen REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS listings_price ON listings (region, price);
+            CREATE INDEX IF NOT EXISTS listings_bedrooms ON listings (region, bedrooms, price);
+            CREATE INDEX IF NOT EXISTS listings_location ON listings (region, neighborhood);
+            CREATE INDEX IF NOT EXISTS listings_last_seen ON listings (last_seen);
+
+            CREATE VIRTUAL TABLE IF NOT EXISTS listings_fts USING fts5 (
+                title, description, location,
+                content='listings', content_rowid='rowid'
+            );
+            CREATE TRIGGER IF NOT EXISTS listings_fts_insert AFTER INSERT ON listings BEGIN
+                INSERT INTO listings_fts (rowid, title, description, location)
+                VALUES (new.rowid, new.title, new.description, new.location);
+            END;
+            CREATE TRIGGER IF NOT EXISTS listings_fts_delete AFTER DELETE ON listings BEGIN
+                INSERT INTO listings_fts (listings_fts, rowid, title, description, location)
+                VALUES ('delete', old.rowid, old.title, old.description, old.location);
+            END;
+            CREATE TRIGGER IF NOT EXISTS listings_fts_update AFTER UPDATE ON listings BEGIN
+                INSERT INTO listings_fts (listings_fts, rowid, title, description, location)
+                VALUES ('delete', old.rowid, old.title, old.description, old.location);
+                INSERT INTO listings_fts (rowid, title, description, location)
+                VALUES (new.rowid, new.title, new.description, new.location);
+            END;
+            """
+        )
+
+    def record(self, post_id: Optional[str], result: GeocodedResult):
+        """Insert or refresh a listing; ``first_seen`` is kept on refresh."""
+        details = result.listing_details
+        post_id = post_id or parse_post_id(details.url)
+        if not post_id:
+            return
+
+        # The URL's subdomain is the region Craigslist filed the post under;
+        # the location text is only trusted for the neighborhood within it.
+        region = neighborhood = None
+        index = get_region_index()
+        subdomain = parse_region(details.url)
+        if subdomain and index.get(subdomain):
+            region = subdomain
+            neighborhood = index.neighborhood(index.get(subdomain), details.location)
+        else:
+            match = resolve_region(details.location)
+            if match is not None:
+                region = match.region.subdomain
+                neighborhood = match.search_term or None
+
+        longitude = latitude = None
+        if result.coordinates and any(result.coordinates):
+            longitude, latitude = result.coordinates[:2]
+
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO listings (post_id, url, title, description, location,"
+                " region, neighborhood, price, bedrooms, bathrooms, longitude, latitude,"
+                " result, first_seen, last_seen)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (post_id) DO UPDATE SET"
+                " url = excluded.url, title = excluded.title,"
+                " description = excluded.description, location = excluded.location,"
+                " region = excluded.region, neighborhood = excluded.neighborhood,"
+                " price = excluded.price, bedrooms = excluded.bedrooms,"
+                " bathrooms = excluded.bathrooms, longitude = excluded.longitude,"
+                " latitude = excluded.latitude, result = excluded.result,"
+                " last_seen = excluded.last_seen",
+                (
+                    post_id,
+                    details.url,
+                    details.title,
+                    details.description,
+                    details.location,
+                    region,
+                    neighborhood,
+                    parse_price(details.price),
+                    details.bedrooms,
+                    details.bathrooms,
+                    longitude,
+                    latitude,
+                    result.model_dump_json(),
+                    now,
+                    now,
+                ),
+            )
+            self.stats.writes += 1
+
+    def query(
+        self,
+        requirements: Requirements,
+        text: Optional[str] = None,
+        max_age_seconds: Optional[float] = None,
+        limit: int = LISTINGS_QUERY_LIMIT,
+    ) -> List[StoredListing]:
+        """Listings matching ``requirements``, most recently seen first.
+
+        The location is resolved like a search: its region must match, and a
+        neighborhood must match either the parsed neighborhood or the
+        listing's location text. ``text`` is matched against title and
+        description.
+        """
+        clauses: List[str] = []
+        params: List[object] = []
+
+        for column, low, high in (
+            ("price", "min_price", "max_price"),
+            ("bedrooms", "min_bedrooms", "max_bedrooms"),
+            ("bathrooms", "min_bathrooms", "max_bathrooms"),
+        ):
+            if requirements.get(low) is not None:
+                clauses.append(f"{column} >= ?")
+                params.append(requirements[low])
+            if requirements.get(high) is not None:
+                clauses.append(f"{column} <= ?")
+                params.append(requirements[high])
+
+        location = requirements.get("location") or ""
+        match = resolve_region(location) if location else None
+        if match is not None:
+            clauses.append("region = ?")
+            params.append(match.region.subdomain)
+            if match.search_term:
+                clauses.append(
+                    "(neighborhood = ? OR rowid IN"
+                    " (SELECT rowid FROM listings_fts WHERE listings_fts MATCH ?))"
+                )
+                params.extend([match.search_term, f"location : {_phrase(match.search_term)}"])
+        elif location:
+            # Not a known region; fall back to the listing's own location text
+            clauses.append("rowid IN (SELECT rowid FROM listings_fts WHERE listings_fts MATCH ?)")
+            params.append(f"location : {_phrase(normalize_location(location))}")
+
+        terms = normalize_location(text or "").split()
+        if terms:
+            clauses.append("rowid IN (SELECT rowid FROM listings_fts WHERE listings_fts MATCH ?)")
+            params.append("{title description} : (" + " AND ".join(map(_phrase, terms)) + ")")
+
+        if max_age_seconds is not None:
+            clauses.append("last_seen >= ?")
+            params.append(time.time() - max_age_seconds)
+
+        where = " AND ".join(clauses) or "1"
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT post_id, result, first_seen, last_seen FROM listings"
+                f" WHERE {where} ORDER BY last_seen DESC LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+            self.stats.queries += 1
+
+        return [
+            StoredListing(
+                post_id=row[0],
+                result=GeocodedResult.model_validate_json(row[1]),
+                first_seen=row[2],
+                last_seen=row[3],
+            )
+            for row in rows
+        ]
+
+    def stats_dict(self) -> dict:
+        with self._lock:
+            count = self._db.execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+        return {**asdict(self.stats), "listings": count}
+
+
+_store: Optional[ListingsStore] = None
+
+
+def get_listings_store() -> ListingsStore:
+    global _store
+    if _store is None:
+        _store = ListingsStore()
+    return _store
@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import BaseModel
+
+from metrics import LLM_CACHE_LOOKUPS, LLM_CACHE_SAVED_SECONDS
+from storage import connect
+
+LLM_CACHE_MEMORY_SIZE = int(os.environ.get("LLM_CACHE_MEMORY_SIZE", "1024"))
+LLM_CACHE_TTL_SECONDS = float(os.environ.get("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Geocoding queries depend only on the listing text, so they can live as long
+# as the coordinates they lead to. Requirements expire sooner so region table
+# fixes reach descriptions the rule parser hands to the LLM.
+LLM_CACHE_SCHEMA_TTL_SECONDS: Dict[str, float] = {
+    "Requirements": float(
+        os.environ.get("LLM_CACHE_REQUIREMENTS_TTL_SECONDS", str(24 * 3600))
+    ),
+    "GeocodingQuery": float(
+        os.environ.get("LLM_CACHE_GEOCODING_TTL_SECONDS", str(30 * 24 * 3600))
+    ),
+}
+
+MISS = object()
+
+
+@dataclass
+class CallSiteStats:
+    hits: int = 0
+    misses: int = 0
+    memory_hits: int = 0
+    disk_hits: int = 0
+    writes: int = 0
+    calls: int = 0
+    call_seconds: float = 0.0
+
+    @property
+    def mean_call_seconds(self) -> float:
+        return self.call_seconds / self.calls if self.calls else 0.0
+
+
+@lru_cache(maxsize=None)
+def _schema_fingerprint(schema) -> str:
+    # The tool definition sent to the model, so a field change is a new key
+    return json.dumps(convert_to_openai_tool(schema), sort_keys=True)
+
+
+def model_name(llm) -> str:
+    return (
+        getattr(llm, "model_name", None)
+        or getattr(llm, "model", None)
+        or type(llm).__name__
+    )
+
+
+def _dump(schema, value) -> str:
+    if isinstance(value, BaseModel):
+        return value.model_dump_json()
+    return json.dumps(value)
+
+
+def _load(schema, data: str):
+    if isinstance(schema, type) and issubclass(schema, BaseModel):
+        return schema.model_validate_json(data)
+    return json.loads(data)
+
+
+class LLMCache:
+    """Structured-output responses keyed by hash(model, schema, prompt).
+
+    Same layout as the geocode cache: a bounded in-memory LRU in front of a
+    SQLite table. Values are kept as JSON and decoded on every hit, so callers
+    can't mutate a cached answer. Only explicit structured-output calls go
+    through here; browser agent steps depend on the live page and are never
+    cached.
+    """
+
+    def __init__(
+        self,
+        filename: str = "llm_cache.sqlite3",
+        memory_size: int = LLM_CACHE_MEMORY_SIZE,
+    ):
+        self.memory_size = memory_size
+        self.call_sites: Dict[str, CallSiteStats] = {}
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = connect(filename)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY,"
+            " schema TEXT NOT NULL,"
+            " response TEXT NOT NULL,"
+            " expires_at REAL NOT NULL)"
+        )
+
+    @staticmethod
+    def key(model: str, schema, prompt: str) -> str:
+        digest = hashlib.sha256()
+        for part in (model, schema.__name__, _schema_fingerprint(schema), prompt):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    @staticmethod
+    def ttl(schema) -> float:
+        return LLM_CACHE_SCHEMA_TTL_SECONDS.get(schema.__name__, LLM_CACHE_TTL_SECONDS)
+
+    def get(self, key: str, schema, call_site: str):
+        """Return the cached response for ``key`` or MISS."""
+        stats = self._stats(call_site)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[1] > now:
+                self._memory.move_to_end(key)
+                stats.memory_hits += 1
+                return self._hit(call_site, "memory_hit", schema, entry[0])
+
+            row = self._db.execute(
+                "SELECT response, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None or row[1] <= now:
+                self._memory.pop(key, None)
+                stats.misses += 1
+                LLM_CACHE_LOOKUPS.inc(call_site=call_site, outcome="miss")
+                return MISS
+
+            self._remember(key, row[0], row[1])
+            stats.disk_hits += 1
+            return self._hit(call_site, "disk_hit", schema, row[0])
+
+    def set(self, key: str, schema, value, call_site: str):
+        if value is None:
+            return
+
+        response = _dump(schema, value)
+        expires_at = time.time() + self.ttl(schema)
+
+        with self._lock:
+            self._remember(key, response, expires_at)
+            self._db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, schema, response, expires_at)"
+                " VALUES (?, ?, ?, ?)",
+                (key, schema.__name__, response, expires_at),
+            )
+            self._stats(call_site).writes += 1
+
+    def record_call(self, call_site: str, seconds: float):
+        """Record how long an uncached model call took at ``call_site``."""
+        stats = self._stats(call_site)
+        stats.calls += 1
+        stats.call_seconds += seconds
+
+    def purge_expired(self):
+        with self._lock:
+            self._db.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+
+    def stats_dict(self) -> dict:
+        call_sites = {}
+        for call_site, stats in self.call_sites.items():
+            lookups = stats.hits + stats.misses
+            call_sites[call_site] = {
+                **asdict(stats),
+                "hit_ratio": stats.hits / lookups if lookups else 0.0,
+                "mean_call_seconds": stats.mean_call_seconds,
+                # Every hit skipped a model call of roughly the average length
+                "saved_seconds": stats.hits * stats.mean_call_seconds,
+            }
+        return {"memory_entries": len(self._memory), "call_sites": call_sites}
+
+    def _stats(self, call_site: str) -> CallSiteStats:
+        stats = self.call_sites.get(call_site)
+        if stats is None:
+            stats = self.call_sites[call_site] = CallSiteStats()
+        return stats
+
+    def _hit(self, call_site: str, outcome: str, schema, response: str):
+        stats = self._stats(call_site)
+        stats.hits += 1
+        LLM_CACHE_LOOKUPS.inc(call_site=call_site, outcome=outcome)
+        LLM_CACHE_SAVED_SECONDS.inc(stats.mean_call_seconds, call_site=call_site)
+        return _load(schema, response)
+
+    def _remember(self, key: str, response: str, expires_at: float):
+        self._memory[key] = (response, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+
+_cache: Optional[LLMCache] = None
+
+
+def get_llm_cache() -> LLMCache:
+    global _cache
+    if _cache is None:
+        _cache = LLMCache()
+    return _cache
+
+
+async def cached_structured_output(llm, schema, prompt: str, call_site: str):
+    """``llm.with_structured_output(schema).ainvoke(prompt)``, served from the
+    cache when the same model has already answered the same prompt."""
+    cache = get_llm_cache()
+    key = cache.key(model_name(llm), schema, prompt)
+
+    cached = cache.get(key, schema, call_site)
+    if cached is not MISS:
+        return cached
+
+    started = time.perf_counter()
+    result = await llm.with_structured_output(schema).ainvoke(prompt)
+    cache.record_call(call_site, time.perf_counter() - started)
+    cache.set(key, schema, result, call_site)
+    return result
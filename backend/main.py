@@ -1,14 +1,49 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
-from pydantic import BaseModel
+from fastapi.responses import FileResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Optional
 import asyncio
+import httpx
 import json
+import time
 import uvicorn
 
-from graph import apartment_finder_graph
+from browser_pool import browser_pool_stats, close_browser_pools
+from http_client import close_http_client
+from geocode_cache import get_geocode_cache
+from listing_cache import get_listing_cache
+from llm_cache import get_llm_cache
+from listings_store import LISTINGS_QUERY_LIMIT, get_listings_store
+from image_proxy import IMAGE_CACHE_CONTROL, IMAGE_VARIANTS, get_image_cache, is_image_key
+from metrics import (
+    agent_mode_stats,
+    render_metrics,
+    search_run_stats,
+    span,
+    start_search_timing,
+)
+from search_events import SearchRequest, search_events
+from jobs import JOB_POLL_SECONDS, TERMINAL_STATUSES, get_job_store
+from worker import JOB_WORKERS, start_workers, stop_workers
+from graph import get_chat_model, resolve_requirements
+from search_url import build_search_url
+from saved_searches import SAVED_SEARCH_INTERVAL_SECONDS, get_saved_search_store
+from coalesce import search_flights, search_key
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # JOB_WORKERS=0 leaves job execution to a separate `python worker.py`
+    workers = start_workers(JOB_WORKERS)
+    yield
+    await asyncio.to_thread(stop_workers, workers)
+    await close_browser_pools()
+    await close_http_client()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,83 +62,34 @@ app.add_middleware(
 )
 
 
-class SearchRequest(BaseModel):
-    description: str
-    planner: str
-    executor: str
-    headless_mode: bool
-    max_listings: int = 10
-
+def sse(event: dict) -> str:
+    return f"data: {json.dumps(event)}\n\n"
 
-async def stream_search_results(request: SearchRequest):
-    graph = apartment_finder_graph(
-        executor_model=request.executor,
-        planner_model=request.planner,
-        headless_mode=request.headless_mode,
-        max_listings=request.max_listings,
-    )
 
-    # Initial status message
-    yield f"data: {json.dumps({'type': 'status', 'message': '🏠 gathering requirements...'})}\n\n"
+async def stream_search_results(request: SearchRequest, http_request: Request):
+    yield sse({"type": "status", "message": "🏠 gathering requirements..."})
 
-    # Set to track which status messages have been sent
-    sent_messages = set()
+    # Requirements are resolved outside the graph, so the span the graph's
+    # extract_requirements node would record is recorded here instead.
+    start_search_timing()
+    with span("node.extract_requirements"):
+        requirements = await resolve_requirements(
+            request.description, get_chat_model(request.executor)
+        )
 
-    async for chunk in graph.astream(
-        {"user_description": request.description}, stream_mode="values"
+    # Identical concurrent searches share one run
+    async for event in search_flights.subscribe(
+        search_key(requirements, request.model_dump()),
+        lambda should_cancel: search_events(request, should_cancel, requirements),
+        http_request.is_disconnected,
     ):
-        # Process requirements
-        if "requirements" in chunk and "requirements" not in sent_messages:
-            sent_messages.add("requirements")
-            yield f"data: {json.dumps({'type': 'status', 'message': '🔍 browsing craigslist...'})}\n\n"
-
-        # Process search results
-        if (
-            "search_results" in chunk
-            and hasattr(chunk["search_results"], "listings")
-            and "search_results" not in sent_messages
-        ):
-            sent_messages.add("search_results")
-            yield f"data: {json.dumps({'type': 'status', 'message': f'📋 inspecting listings...'})}\n\n"
-
-            listing_urls = []
-            for listing in chunk["search_results"].listings:
-                if hasattr(listing, "url"):
-                    listing_urls.append(listing.url)
-                elif hasattr(listing, "model_dump"):
-                    listing_data = listing.model_dump()
-                    if "url" in listing_data:
-                        listing_urls.append(listing_data["url"])
-
-            yield f"data: {json.dumps({'type': 'search_results', 'count': len(chunk["search_results"].listings), 'urls': listing_urls})}\n\n"
-
-        # Process geocoded listings
-        if (
-            "geocoded_listings" in chunk
-            and chunk["geocoded_listings"]
-            and "geocoded_listings" not in sent_messages
-        ):
-            sent_messages.add("geocoded_listings")
-            yield f"data: {json.dumps({'type': 'status', 'message': f'🏢 mapping listings...'})}\n\n"
-
-            listings_data = []
-            for listing in chunk["geocoded_listings"]:
-                if hasattr(listing, "model_dump"):
-                    listings_data.append(listing.model_dump())
-                else:
-                    listings_data.append(vars(listing))
-
-            yield f"data: {json.dumps({'type': 'listings', 'data': listings_data})}\n\n"
-
-        await asyncio.sleep(0.05)
-
-    yield f"data: {json.dumps({'type': 'complete', 'message': '✅ search completed successfully!'})}\n\n"
+        yield sse(event)
 
 
 @app.post("/api/search/stream")
-async def stream_search(request: SearchRequest):
+async def stream_search(request: SearchRequest, http_request: Request):
     return StreamingResponse(
-        stream_search_results(request),
+        stream_search_results(request, http_request),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -112,10 +98,249 @@ async def stream_search(request: SearchRequest):
     )
 
 
+@app.post("/api/search")
+async def create_search(request: SearchRequest):
+    job = get_job_store().create(request.model_dump())
+    return {"id": job.id, "status": job.status}
+
+
+@app.get("/api/search/{job_id}")
+async def get_search(job_id: str):
+    job = get_job_store().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="search not found")
+    return job.to_dict()
+
+
+@app.delete("/api/search/{job_id}")
+async def cancel_search(job_id: str):
+    store = get_job_store()
+    if store.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="search not found")
+    store.cancel(job_id)
+    return store.get(job_id).to_dict()
+
+
+async def tail_events(fetch_events, finished, after: int, http_request: Request):
+    """Replay stored events after ``after``, then follow new ones until
+    ``finished()`` or the client disconnects."""
+    while True:
+        # Check before reading events: producers append their last event
+        # before marking themselves finished, so nothing can be missed.
+        done = finished()
+        events = fetch_events(after)
+
+        for seq, event in events:
+            after = seq
+            yield f"id: {seq}\ndata: {event}\n\n"
+
+        if not events:
+            if done:
+                return
+            if await http_request.is_disconnected():
+                return
+            await asyncio.sleep(JOB_POLL_SECONDS)
+
+
+@app.get("/api/search/{job_id}/stream")
+async def stream_search_job(
+    job_id: str,
+    http_request: Request,
+    after: int = 0,
+    last_event_id: Optional[int] = Header(None),
+):
+    """Replay a job's stored events, then tail new ones until it finishes.
+
+    Reconnecting clients resume with ``after`` or the Last-Event-ID header.
+    """
+    if get_job_store().get(job_id) is None:
+        raise HTTPException(status_code=404, detail="search not found")
+
+    store = get_job_store()
+    return StreamingResponse(
+        tail_events(
+            lambda after: store.events(job_id, after),
+            lambda: store.get(job_id).status in TERMINAL_STATUSES,
+            max(after, last_event_id or 0),
+            http_request,
+        ),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        },
+    )
+
+
+class SavedSearchRequest(SearchRequest):
+    interval_seconds: float = SAVED_SEARCH_INTERVAL_SECONDS
+
+
+@app.post("/api/saved-searches")
+async def create_saved_search(request: SavedSearchRequest):
+    search_request = SearchRequest.model_validate(request.model_dump())
+    requirements = await resolve_requirements(
+        request.description, get_chat_model(request.executor)
+    )
+    search_url = build_search_url(requirements)
+    if search_url is None:
+        raise HTTPException(
+            status_code=422,
+            detail=f"couldn't resolve a craigslist region for {requirements['location']!r}",
+        )
+
+    saved = get_saved_search_store().create(
+        search_request.model_dump(), requirements, search_url, request.interval_seconds
+    )
+    return saved.to_dict()
+
+
+@app.get("/api/saved-searches")
+async def list_saved_searches():
+    return [saved.to_dict() for saved in get_saved_search_store().list()]
+
+
+@app.get("/api/saved-searches/{search_id}")
+async def get_saved_search(search_id: str):
+    saved = get_saved_search_store().get(search_id)
+    if saved is None:
+        raise HTTPException(status_code=404, detail="saved search not found")
+    return saved.to_dict()
+
+
+@app.delete("/api/saved-searches/{search_id}")
+async def delete_saved_search(search_id: str):
+    if not get_saved_search_store().delete(search_id):
+        raise HTTPException(status_code=404, detail="saved search not found")
+    return {"id": search_id, "deleted": True}
+
+
+@app.get("/api/saved-searches/{search_id}/stream")
+async def subscribe_saved_search(
+    search_id: str,
+    http_request: Request,
+    after: int = 0,
+    last_event_id: Optional[int] = Header(None),
+):
+    """Subscribe to a saved search: stored events first, then each poll's
+    new listings as they are found."""
+    store = get_saved_search_store()
+    if store.get(search_id) is None:
+        raise HTTPException(status_code=404, detail="saved search not found")
+
+    return StreamingResponse(
+        tail_events(
+            lambda after: store.events(search_id, after),
+            lambda: store.get(search_id) is None,
+            max(after, last_event_id or 0),
+            http_request,
+        ),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        },
+    )
+
+
+class ListingsQuery(BaseModel):
+    location: str = ""
+    min_price: Optional[int] = None
+    max_price: Optional[int] = None
+    min_bedrooms: Optional[int] = None
+    max_bedrooms: Optional[int] = None
+    min_bathrooms: Optional[float] = None
+    max_bathrooms: Optional[float] = None
+    # matched against title and description
+    text: Optional[str] = None
+    max_age_seconds: Optional[float] = None
+    limit: int = Field(LISTINGS_QUERY_LIMIT, ge=1, le=500)
+
+
+@app.post("/api/listings/query")
+async def query_listings(query: ListingsQuery):
+    """Answer a Requirements query from listings earlier searches found."""
+    started = time.perf_counter()
+    listings = get_listings_store().query(
+        query.model_dump(exclude={"text", "max_age_seconds", "limit"}),
+        text=query.text,
+        max_age_seconds=query.max_age_seconds,
+        limit=query.limit,
+    )
+    return {
+        "count": len(listings),
+        "listings": [listing.to_dict() for listing in listings],
+        "query_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+
+
 @app.get("/api/health")
 async def health_check():
     return {"status": "ok"}
 
 
+@app.get("/api/browser-pool")
+async def browser_pool():
+    return browser_pool_stats()
+
+
+@app.get("/api/geocode-cache")
+async def geocode_cache():
+    return get_geocode_cache().stats_dict()
+
+
+@app.get("/api/listings/stats")
+async def listings_stats():
+    return get_listings_store().stats_dict()
+
+
+@app.get("/api/images/{key}")
+async def image(key: str, size: str = "full", if_none_match: Optional[str] = Header(None)):
+    """A Craigslist listing photo, resized to ``size`` and cached on disk."""
+    if not is_image_key(key) or size not in IMAGE_VARIANTS:
+        raise HTTPException(status_code=404, detail="image not found")
+
+    try:
+        cached = await get_image_cache().image(key, size)
+    except (httpx.HTTPError, OSError, LookupError):
+        raise HTTPException(status_code=502, detail="image unavailable")
+
+    headers = {"ETag": cached.etag, "Cache-Control": IMAGE_CACHE_CONTROL}
+    if if_none_match and cached.etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(cached.path, media_type="image/jpeg", headers=headers)
+
+
+@app.get("/api/image-cache")
+async def image_cache():
+    return get_image_cache().stats_dict()
+
+
+@app.get("/api/extraction-modes")
+async def extraction_modes():
+    """Agent seconds per step and tokens per run, by extraction mode."""
+    return agent_mode_stats()
+
+
+@app.get("/api/llm-cache")
+async def llm_cache():
+    return get_llm_cache().stats_dict()
+
+
+@app.get("/api/listing-cache")
+async def listing_cache():
+    return get_listing_cache().stats_dict()
+
+
+@app.get("/api/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/search-runs")
+async def search_runs():
+    return {**search_run_stats(), "coalescing": search_flights.stats_dict()}
+
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,381 @@
+import asyncio
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import AsyncCallbackHandler
+
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+STEP_BUCKETS = (1, 2, 3, 5, 8, 10, 15, 20, 30)
+TOKEN_BUCKETS = (100, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000)
+
+# USD per million (input, output) tokens, for rough per-search cost figures
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+    "claude-3-5-sonnet-latest": (3.00, 15.00),
+}
+
+
+def _labels(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def total(self) -> float:
+        return sum(self._values.values())
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        # Per-bucket counts, then sum and count
+        series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[index] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(self._series.items()):
+            for bound, count in zip(self.buckets, series):
+                le = _labels(self.labelnames, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{le} {count:g}")
+            inf = _labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf} {series[-1]:g}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {series[-1]:g}")
+        return lines
+
+
+SPAN_SECONDS = Histogram(
+    "craigslist_agent_span_seconds",
+    "Duration of graph nodes, agent runs, geocodes, fetches and browser launches.",
+    ["span", "outcome"],
+)
+AGENT_STEPS = Histogram(
+    "craigslist_agent_agent_steps",
+    "Steps taken per agent run.",
+    ["agent", "mode"],
+    STEP_BUCKETS,
+)
+AGENT_STEP_SECONDS = Histogram(
+    "craigslist_agent_agent_step_seconds",
+    "Mean step duration per agent run.",
+    ["agent", "mode"],
+)
+AGENT_LLM_CALLS = Histogram(
+    "craigslist_agent_agent_llm_calls",
+    "LLM calls per agent run.",
+    ["agent", "mode"],
+    STEP_BUCKETS,
+)
+AGENT_TOKENS = Histogram(
+    "craigslist_agent_agent_tokens",
+    "LLM tokens per agent run.",
+    ["agent", "mode", "direction"],
+    TOKEN_BUCKETS,
+)
+AGENT_SCREENSHOTS = Counter(
+    "craigslist_agent_agent_screenshots_total",
+    "Screenshots sent to the LLM.",
+    ["agent", "mode"],
+)
+LLM_CALLS = Counter("craigslist_agent_llm_calls_total", "LLM calls.", ["model"])
+LLM_TOKENS = Counter(
+    "craigslist_agent_llm_tokens_total", "LLM tokens.", ["model", "direction"]
+)
+LLM_COST = Counter(
+    "craigslist_agent_llm_cost_dollars_total", "Estimated LLM spend in USD.", ["model"]
+)
+SEARCH_RUNS = Counter(
+    "craigslist_agent_search_runs_total", "Search runs by outcome.", ["outcome"]
+)
+LLM_CACHE_LOOKUPS = Counter(
+    "craigslist_agent_llm_cache_lookups_total",
+    "Structured-output cache lookups.",
+    ["call_site", "outcome"],
+)
+LLM_CACHE_SAVED_SECONDS = Counter(
+    "craigslist_agent_llm_cache_saved_seconds_total",
+    "Estimated model latency avoided by structured-output cache hits.",
+    ["call_site"],
+)
+
+_REGISTRY = [
+    SPAN_SECONDS,
+    AGENT_STEPS,
+    AGENT_STEP_SECONDS,
+    AGENT_LLM_CALLS,
+    AGENT_TOKENS,
+    AGENT_SCREENSHOTS,
+    LLM_CALLS,
+    LLM_TOKENS,
+    LLM_COST,
+    SEARCH_RUNS,
+    LLM_CACHE_LOOKUPS,
+    LLM_CACHE_SAVED_SECONDS,
+]
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+@dataclass
+class Usage:
+    llm_calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost_usd: float = 0.0
+
+
+# Per-search timing breakdown and per-agent-run usage. Tasks spawned during a
+# search inherit the context, so they all add to the same objects.
+_search_timing: ContextVar[Optional[Dict[str, Any]]] = ContextVar(
+    "search_timing", default=None
+)
+_search_usage: ContextVar[Optional[Usage]] = ContextVar("search_usage", default=None)
+_agent_usage: ContextVar[Optional[Usage]] = ContextVar("agent_usage", default=None)
+
+
+def start_search_timing():
+    """Start collecting a timing breakdown for the search in this context."""
+    _search_timing.set({})
+    _search_usage.set(Usage())
+
+
+def search_timing() -> dict:
+    timing = _search_timing.get() or {}
+    breakdown = {
+        name: {"count": entry["count"], "seconds": round(entry["seconds"], 3)}
+        for name, entry in sorted(timing.items())
+    }
+    usage = _search_usage.get()
+    if usage is not None:
+        breakdown["llm"] = {**asdict(usage), "cost_usd": round(usage.cost_usd, 4)}
+    return breakdown
+
+
+@contextmanager
+def span(name: str):
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        SPAN_SECONDS.observe(elapsed, span=name, outcome=outcome)
+        timing = _search_timing.get()
+        if timing is not None:
+            entry = timing.setdefault(name, {"count": 0, "seconds": 0.0})
+            entry["count"] += 1
+            entry["seconds"] += elapsed
+
+
+def timed(name: str):
+    """Decorate a coroutine function so each call is recorded as a span."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+@dataclass
+class AgentModeStats:
+    runs: int = 0
+    steps: int = 0
+    seconds: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    screenshots: int = 0
+
+
+# (agent, extraction mode) -> totals, for comparing the modes side by side
+agent_modes: Dict[Tuple[str, str], AgentModeStats] = {}
+
+
+async def run_agent(name: str, agent, **run_kwargs):
+    """``agent.run()`` recorded as a span, with its steps, LLM calls, tokens
+    and screenshots, labelled with the agent's extraction mode."""
+    mode = getattr(agent, "extraction_mode", "vision")
+    usage = Usage()
+    token = _agent_usage.set(usage)
+    started = time.perf_counter()
+    try:
+        with span(f"agent.{name}"):
+            history = await agent.run(**run_kwargs)
+    finally:
+        _agent_usage.reset(token)
+    elapsed = time.perf_counter() - started
+
+    steps = history.number_of_steps()
+    AGENT_STEPS.observe(steps, agent=name, mode=mode)
+    if steps:
+        AGENT_STEP_SECONDS.observe(elapsed / steps, agent=name, mode=mode)
+    AGENT_LLM_CALLS.observe(usage.llm_calls, agent=name, mode=mode)
+    AGENT_TOKENS.observe(usage.input_tokens, agent=name, mode=mode, direction="input")
+    AGENT_TOKENS.observe(usage.output_tokens, agent=name, mode=mode, direction="output")
+
+    screenshots = getattr(agent, "vision_steps", None)
+    if screenshots is None:
+        settings = getattr(agent, "settings", agent)
+        screenshots = 0
+        if getattr(settings, "use_vision", False):
+            screenshots = sum(1 for screenshot in history.screenshots() if screenshot)
+    AGENT_SCREENSHOTS.inc(screenshots, agent=name, mode=mode)
+
+    stats = agent_modes.setdefault((name, mode), AgentModeStats())
+    stats.runs += 1
+    stats.steps += steps
+    stats.seconds += elapsed
+    stats.input_tokens += usage.input_tokens
+    stats.output_tokens += usage.output_tokens
+    stats.screenshots += screenshots
+
+    return history
+
+
+def agent_mode_stats() -> Dict[str, Dict[str, dict]]:
+    """Per agent and extraction mode: seconds per step and tokens per run.
+
+    Each listing_details run extracts one posting, so its tokens per run is
+    the cost per listing.
+    """
+    report: Dict[str, Dict[str, dict]] = {}
+    for (name, mode), stats in sorted(agent_modes.items()):
+        tokens = stats.input_tokens + stats.output_tokens
+        report.setdefault(name, {})[mode] = {
+            **asdict(stats),
+            "seconds_per_step": stats.seconds / stats.steps if stats.steps else 0.0,
+            "tokens_per_step": tokens / stats.steps if stats.steps else 0.0,
+            "tokens_per_run": tokens / stats.runs if stats.runs else 0.0,
+            "screenshots_per_step": stats.screenshots / stats.steps if stats.steps else 0.0,
+        }
+    return report
+
+
+def _token_usage(response) -> Tuple[int, int]:
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+
+    usage = (response.llm_output or {}).get("token_usage") or (
+        response.llm_output or {}
+    ).get("usage") or {}
+    return (
+        usage.get("prompt_tokens", usage.get("input_tokens", 0)),
+        usage.get("completion_tokens", usage.get("output_tokens", 0)),
+    )
+
+
+class UsageCallbackHandler(AsyncCallbackHandler):
+    """Counts calls, tokens and estimated cost for one chat model."""
+
+    def __init__(self, model: str):
+        self._model = model
+
+    async def on_llm_end(self, response, **kwargs):
+        input_tokens, output_tokens = _token_usage(response)
+        input_price, output_price = MODEL_PRICES.get(self._model, (0.0, 0.0))
+        cost = (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+        LLM_CALLS.inc(model=self._model)
+        LLM_TOKENS.inc(input_tokens, model=self._model, direction="input")
+        LLM_TOKENS.inc(output_tokens, model=self._model, direction="output")
+        LLM_COST.inc(cost, model=self._model)
+
+        for usage in (_search_usage.get(), _agent_usage.get()):
+            if usage is not None:
+                usage.llm_calls += 1
+                usage.input_tokens += input_tokens
+                usage.output_tokens += output_tokens
+                usage.cost_usd += cost
+
+
+@dataclass
+class SearchRunStats:
+    started: int = 0
+    completed: int = 0
+    failed: int = 0
+    cancelled: int = 0
+    # Wall time abandoned runs spent before they were cancelled
+    cancelled_seconds: float = 0.0
+
+
+search_runs = SearchRunStats()
+
+
+def track_search_run(task: asyncio.Task):
+    """Count ``task`` as a search run and record how it ended."""
+    started = time.perf_counter()
+    search_runs.started += 1
+
+    def finished(task: asyncio.Task):
+        if task.cancelled():
+            outcome = "cancelled"
+            search_runs.cancelled += 1
+            search_runs.cancelled_seconds += time.perf_counter() - started
+        elif task.exception() is not None:
+            outcome = "failed"
+            search_runs.failed += 1
+        else:
+            outcome = "completed"
+            search_runs.completed += 1
+        SEARCH_RUNS.inc(outcome=outcome)
+
+    task.add_done_callback(finished)
+
+
+def search_run_stats() -> dict:
+    return asdict(search_runs)
@@ -1,4 +1,4 @@
-from typing import List, Optional, TypedDict
+from typing import Dict, List, Optional, TypedDict
 from pydantic import BaseModel, Field
 
 
@@ -20,6 +20,15 @@ class ListingUrl(BaseModel):
     url: str = Field(description="URL for a single apartment listing")
 
 
+class ListingCard(ListingUrl):
+    post_id: Optional[str] = Field(None, description="Craigslist post ID")
+    title: Optional[str] = Field(None, description="title shown on the result card")
+    price: Optional[str] = Field(None, description="dollar string shown on the card")
+    bedrooms: Optional[int] = Field(None, description="number of bedrooms")
+    neighborhood: Optional[str] = Field(None, description="neighborhood label")
+    thumbnail: Optional[str] = Field(None, description="url of the card thumbnail")
+
+
 class SearchResults(BaseModel):
     listings: List[ListingUrl] = Field(
         default_factory=list, description="List of apartment listing URLs"
@@ -64,6 +73,18 @@ class GeocodingQuery(BaseModel):
     )
 
 
+class BatchGeocodingQuery(GeocodingQuery):
+    listing_index: int = Field(
+        description="Index of the listing this query belongs to, as given in the prompt"
+    )
+
+
+class GeocodingQueries(BaseModel):
+    queries: List[BatchGeocodingQuery] = Field(
+        default_factory=list, description="One geocoding query per listing"
+    )
+
+
 class GeocodedResult(BaseModel):
     listing_details: ListingDetails
     coordinates: List[float]
@@ -72,5 +93,10 @@ class GeocodedResult(BaseModel):
 class ApartmentFinderState(TypedDict):
     user_description: str
     requirements: Optional[Requirements] = None
+    search_url: Optional[SearchUrl] = None
     search_results: Optional[SearchResults] = None
     geocoded_listings: Optional[List[GeocodedResult]] = None
+    # kept post ID -> post IDs collapsed into it as reposts
+    merged_post_ids: Optional[Dict[str, List[str]]] = None
+    # post IDs of the cards the listing stage tried, in the order they finished
+    attempted_post_ids: Optional[List[str]] = None
@@ -0,0 +1,77 @@
+import asyncio
+import os
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Deque, List
+
+from models import ListingUrl
+from parsers import listing_post_id
+from search_url import page_url
+
+SEARCH_PAGE_SIZE = int(os.environ.get("SEARCH_PAGE_SIZE", "120"))
+SEARCH_MAX_PAGES = int(os.environ.get("SEARCH_MAX_PAGES", "5"))
+SEARCH_PAGE_PREFETCH = int(os.environ.get("SEARCH_PAGE_PREFETCH", "2"))
+# Start fetching the next page once this few listings are left unread
+SEARCH_PREFETCH_LOW_WATER = int(os.environ.get("SEARCH_PREFETCH_LOW_WATER", "20"))
+
+
+async def harvest_listings(
+    search_url: str,
+    first_page: List[ListingUrl],
+    fetch_page: Callable[[str], Awaitable[List[ListingUrl]]],
+    max_pages: int = SEARCH_MAX_PAGES,
+    prefetch: int = SEARCH_PAGE_PREFETCH,
+    low_water: int = SEARCH_PREFETCH_LOW_WATER,
+) -> AsyncIterator[ListingUrl]:
+    """Yield listings from successive result pages (``s=`` offsets).
+
+    Later pages are requested only once the reader gets within ``low_water``
+    listings of the end of what has been fetched, with up to ``prefetch``
+    pages in flight. Closing the generator cancels outstanding fetches, so a
+    caller that has enough listings simply stops iterating.
+    """
+    seen = set()
+    buffered: Deque[ListingUrl] = deque()
+    pending: Deque[asyncio.Task] = deque()
+    offsets = iter(range(SEARCH_PAGE_SIZE, SEARCH_PAGE_SIZE * max_pages, SEARCH_PAGE_SIZE))
+    exhausted = not first_page
+
+    def add(listings: List[ListingUrl]) -> int:
+        added = 0
+        for listing in listings:
+            key = listing_post_id(listing) or listing.url
+            if key not in seen:
+                seen.add(key)
+                buffered.append(listing)
+                added += 1
+        return added
+
+    def fill():
+        while not exhausted and len(pending) < prefetch:
+            offset = next(offsets, None)
+            if offset is None:
+                return
+            pending.append(asyncio.create_task(fetch_page(page_url(search_url, offset))))
+
+    add(first_page)
+    try:
+        while buffered or pending:
+            if len(buffered) <= low_water:
+                fill()
+
+            if not buffered:
+                listings = await pending.popleft()
+                # Past the last page Craigslist returns nothing or repeats
+                # earlier results.
+                if not add(listings):
+                    exhausted = True
+                    for task in pending:
+                        task.cancel()
+                    await asyncio.gather(*pending, return_exceptions=True)
+                    pending.clear()
+                continue
+
+            yield buffered.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
@@ -0,0 +1,328 @@
+import json
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup, Tag
+
+from models import ListingCard, ListingDetails, ListingUrl
+
+_POST_ID = re.compile(r"/(\d{8,})\.html")
+_BEDROOMS = re.compile(r"(\d+)\s*(?:br|bd|bed|bedroom|bedrooms)\b", re.IGNORECASE)
+_STUDIO = re.compile(r"\bstudio\b", re.IGNORECASE)
+_PRICE = re.compile(r"\$[\d,]+")
+_PRICE_AMOUNT = re.compile(r"\$?\s*(\d[\d,]*(?:\.\d+)?)\s*(k\b)?", re.IGNORECASE)
+_WHITESPACE = re.compile(r"\s+")
+_BATHROOMS = re.compile(r"(\d+(?:\.\d+)?)\s*(?:ba|bath|baths|bathroom|bathrooms)\b", re.IGNORECASE)
+_IMAGE_ID = re.compile(r"([0-9A-Za-z]{5}_[0-9A-Za-z]+_[0-9A-Za-z]+)_\d+x\d+c?\.jpg")
+_REGION_HOST = re.compile(r"^https?://([a-z0-9]+)\.craigslist\.org/", re.IGNORECASE)
+_IMG_LIST = re.compile(r"var imgList = (\[.*?\]);", re.DOTALL)
+
+IMAGE_URL_TEMPLATE = "https://images.craigslist.org/{image_id}_1200x900.jpg"
+
+# Static results are served to non-JS clients, cl-search-result cards are what
+# the rendered page shows in gallery and list mode, and result-row is the
+# legacy layout still returned by some regions.
+_CARD_SELECTOR = "li.cl-static-search-result, li.cl-search-result, li.result-row"
+
+
+def parse_post_id(url: str) -> Optional[str]:
+    match = _POST_ID.search(url)
+    return match.group(1) if match else None
+
+
+def parse_region(url: str) -> Optional[str]:
+    """Craigslist region subdomain of a listing or search URL."""
+    match = _REGION_HOST.match(url or "")
+    return match.group(1).lower() if match else None
+
+
+def parse_image_id(url: str) -> Optional[str]:
+    """Craigslist image ID, shared by every size variant of the same photo."""
+    match = _IMAGE_ID.search(url or "")
+    return match.group(1) if match else None
+
+
+def listing_post_id(listing_url: ListingUrl) -> Optional[str]:
+    return getattr(listing_url, "post_id", None) or parse_post_id(listing_url.url)
+
+
+def parse_price(text: str) -> Optional[int]:
+    """Whole dollars from a price string like "$3,950" or "$3.9k"."""
+    match = _PRICE_AMOUNT.search(text or "")
+    if match is None:
+        return None
+    amount = float(match.group(1).replace(",", ""))
+    if match.group(2):
+        amount *= 1000
+    return int(amount)
+
+
+def parse_bedrooms(text: str) -> Optional[int]:
+    match = _BEDROOMS.search(text)
+    if match:
+        return int(match.group(1))
+    if _STUDIO.search(text):
+        return 0
+    return None
+
+
+def _text(node: Optional[Tag]) -> Optional[str]:
+    if node is None:
+        return None
+    text = _WHITESPACE.sub(" ", node.get_text(" ", strip=True)).strip()
+    return text or None
+
+
+def _listing_link(card: Tag) -> Optional[Tag]:
+    for link in card.select("a[href]"):
+        if _POST_ID.search(link["href"]):
+            return link
+    return None
+
+
+def _thumbnail(card: Tag) -> Optional[str]:
+    image = card.select_one("img[src]")
+    if image:
+        return image["src"]
+
+    gallery = card.select_one("[data-ids]")
+    if gallery:
+        first_id = gallery["data-ids"].split(",")[0].split(":")[-1]
+        if first_id:
+            return f"https://images.craigslist.org/{first_id}_300x300.jpg"
+
+    return None
+
+
+def _neighborhood(card: Tag) -> Optional[str]:
+    hood = _text(card.select_one(".location, .result-hood, .supertitle"))
+    if hood:
+        return hood.strip("() ")
+
+    meta = card.select_one(".meta")
+    if meta:
+        # "17 mins ago · 2br 950ft2 · north beach" - the hood is the last segment
+        segments = [_text(part) for part in meta.find_all(string=True, recursive=False)]
+        segments = [segment for segment in segments if segment]
+        if segments:
+            return segments[-1]
+
+    return None
+
+
+def _parse_card(card: Tag, base_url: str) -> Optional[ListingCard]:
+    link = _listing_link(card)
+    if link is None:
+        return None
+
+    url = urljoin(base_url, link["href"])
+    post_id = card.get("data-pid") or parse_post_id(url)
+
+    title = (
+        card.get("title")
+        or _text(card.select_one(".label, .title, .result-title"))
+        or _text(link)
+    )
+
+    price_text = _text(card.select_one(".priceinfo, .price, .result-price"))
+    price_match = _PRICE.search(price_text or "")
+
+    housing = _text(card.select_one(".housing-meta, .housing, .post-bedrooms"))
+    bedrooms = parse_bedrooms(housing or "")
+    if bedrooms is None:
+        bedrooms = parse_bedrooms(title or "")
+
+    return ListingCard(
+        url=url,
+        post_id=post_id,
+        title=title,
+        price=price_match.group(0) if price_match else None,
+        bedrooms=bedrooms,
+        neighborhood=_neighborhood(card),
+        thumbnail=_thumbnail(card),
+    )
+
+
+def parse_search_results(html: str, base_url: str) -> List[ListingCard]:
+    soup = BeautifulSoup(html, "html.parser")
+    listings = []
+    seen = set()
+
+    for card in soup.select(_CARD_SELECTOR):
+        if "nearby" in (card.get("class") or []):
+            continue
+
+        listing = _parse_card(card, base_url)
+        if listing is None:
+            continue
+
+        key = listing.post_id or listing.url
+        if key in seen:
+            continue
+        seen.add(key)
+        listings.append(listing)
+
+    return listings
+
+
+@dataclass
+class ListingPage:
+    details: Optional[ListingDetails] = None
+    coordinates: Optional[List[float]] = None
+    posted_at: Optional[str] = None
+    updated_at: Optional[str] = None
+
+
+def parse_bathrooms(text: str) -> Optional[float]:
+    match = _BATHROOMS.search(text)
+    return float(match.group(1)) if match else None
+
+
+def _posting_data(soup: BeautifulSoup) -> dict:
+    script = soup.select_one("script#ld_posting_data, script[type='application/ld+json']")
+    if script is None or not script.string:
+        return {}
+    try:
+        data = json.loads(script.string)
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _coordinates(soup: BeautifulSoup, posting_data: dict) -> Optional[List[float]]:
+    latitude = longitude = None
+
+    map_node = soup.select_one("#map[data-latitude][data-longitude]")
+    if map_node is not None:
+        latitude, longitude = map_node["data-latitude"], map_node["data-longitude"]
+    elif "latitude" in posting_data and "longitude" in posting_data:
+        latitude, longitude = posting_data["latitude"], posting_data["longitude"]
+
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None
+
+    if latitude == 0 and longitude == 0:
+        return None
+
+    # Mapbox order, matching what geocode() returns
+    return [longitude, latitude]
+
+
+def _images(soup: BeautifulSoup, html: str, posting_data: dict) -> List[str]:
+    candidates = []
+
+    img_list = _IMG_LIST.search(html)
+    if img_list:
+        try:
+            candidates.extend(image.get("url", "") for image in json.loads(img_list.group(1)))
+        except ValueError:
+            pass
+
+    images = posting_data.get("image") or []
+    candidates.extend(images if isinstance(images, list) else [images])
+    candidates.extend(link["href"] for link in soup.select("#thumbs a[href]"))
+    candidates.extend(image["src"] for image in soup.select(".gallery img[src]"))
+
+    urls = []
+    seen = set()
+    for candidate in candidates:
+        image_id = parse_image_id(candidate)
+        if image_id and image_id not in seen:
+            seen.add(image_id)
+            urls.append(IMAGE_URL_TEMPLATE.format(image_id=image_id))
+    return urls
+
+
+def _description(soup: BeautifulSoup) -> Optional[str]:
+    body = soup.select_one("#postingbody")
+    if body is None:
+        return None
+    for node in body.select(".print-information"):
+        node.decompose()
+    lines = [line.strip() for line in body.get_text("\n").splitlines()]
+    return "\n".join(line for line in lines if line) or None
+
+
+def _timestamp(soup: BeautifulSoup, label: str) -> Optional[str]:
+    for info in soup.select(".postinginfo"):
+        time = info.select_one("time[datetime]")
+        if time is not None and info.get_text(strip=True).lower().startswith(label):
+            return time["datetime"]
+    return None
+
+
+def parse_listing_page(html: str, url: str) -> ListingPage:
+    """Parse a posting page into ListingDetails.
+
+    ``details`` is left as None when any required field is missing (including
+    deleted or expired postings) so the caller can hand the page to the agent.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    posting_data = _posting_data(soup)
+    address_data = posting_data.get("address") or {}
+
+    page = ListingPage(
+        coordinates=_coordinates(soup, posting_data),
+        posted_at=_timestamp(soup, "posted"),
+        updated_at=_timestamp(soup, "updated"),
+    )
+
+    title = _text(soup.select_one("#titletextonly")) or posting_data.get("name")
+    price_match = _PRICE.search(_text(soup.select_one(".postingtitletext .price")) or "")
+
+    housing = " ".join(
+        filter(
+            None,
+            [_text(soup.select_one(".postingtitletext .housing"))]
+            + [_text(attr) for attr in soup.select(".attrgroup .attr")],
+        )
+    )
+
+    bedrooms = posting_data.get("numberOfBedrooms")
+    if bedrooms is None:
+        bedrooms = parse_bedrooms(housing) if housing else None
+    if bedrooms is None and title:
+        bedrooms = parse_bedrooms(title)
+
+    bathrooms = posting_data.get("numberOfBathroomsTotal")
+    if bathrooms is None:
+        bathrooms = parse_bathrooms(housing)
+
+    hood = None
+    title_text = soup.select_one(".postingtitletext")
+    if title_text is not None:
+        for span in title_text.find_all("span", recursive=False):
+            text = _text(span)
+            if text and text.startswith("(") and text.endswith(")"):
+                hood = text.strip("() ")
+
+    locality = ", ".join(
+        filter(None, [address_data.get("addressLocality"), address_data.get("addressRegion")])
+    )
+    location = ", ".join(filter(None, [hood, locality])) or None
+
+    address = _text(soup.select_one(".mapaddress")) or address_data.get("streetAddress")
+    if address and locality and locality.lower() not in address.lower():
+        address = f"{address}, {locality}"
+
+    description = _description(soup)
+
+    if not (title and price_match and location and description) or bedrooms is None:
+        return page
+
+    page.details = ListingDetails(
+        title=title,
+        price=price_match.group(0),
+        location=location,
+        address=address,
+        url=url,
+        bedrooms=int(bedrooms),
+        bathrooms=float(bathrooms) if bathrooms is not None else None,
+        description=description,
+        images=_images(soup, html, posting_data),
+    )
+    return page
@@ -330,3 +330,48 @@ Guidelines:
 7. For limit parameter:
    - Keep the default of 1 to return only the most relevant result
 """
+
+batch_geocoding_prompt = """
+You are analyzing several Craigslist apartment listings to extract the most accurate location information for geocoding each one with the Mapbox API.
+Return exactly one query per listing and set listing_index to the index shown in the listing's header.
+
+{listings}
+
+Follow these guidelines for every listing:
+1. Analyze all available location information from the listing
+2. Prioritize information in this order:
+   - Exact street address with number
+   - Intersection of streets
+   - Neighborhood with nearby landmarks
+   - General area description
+
+3. For the search_text field:
+   - Create the most specific location string possible
+   - Include street number and name if available
+   - Add city, state, and zip code when present
+   - Format as "123 Main St, San Francisco, CA 94103" if possible
+
+4. For country parameter:
+   - Default to ["us"] for United States listings
+   - Change only if listing is clearly in another country
+
+5. For types parameter:
+   - Use ["address"] when you have a specific street address
+   - Use ["poi"] (point of interest) when referencing landmarks
+   - Use ["neighborhood"] when only neighborhood information is available
+   - Can include multiple types if appropriate (e.g., ["address", "poi"])
+
+6. For autocomplete parameter:
+   - Set to false for exact matching (better for precise addresses)
+   - Set to true only if the address information is vague or incomplete
+
+7. For limit parameter:
+   - Keep the default of 1 to return only the most relevant result
+"""
+
+batch_geocoding_listing_template = """<Listing index={index}>
+Listing Title: {title}
+Location: {location}
+Address (if available): {address}
+Description: {description}
+</Listing>"""
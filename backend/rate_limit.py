@@ -0,0 +1,89 @@
+import asyncio
+import os
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+from langchain_core.callbacks import AsyncCallbackHandler
+
+
+def _limit(name: str, rate: str, burst: str) -> Tuple[float, float]:
+    return (
+        float(os.environ.get(f"{name}_REQUESTS_PER_SECOND", rate)),
+        float(os.environ.get(f"{name}_BURST", burst)),
+    )
+
+
+# Requests per second and burst size per target host. A rate of 0 disables
+# limiting for that host.
+# Hosts are matched in order, so the image CDN comes before craigslist.org.
+HOST_RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    "images.craigslist.org": _limit("CRAIGSLIST_IMAGES", "10", "20"),
+    "craigslist.org": _limit("CRAIGSLIST", "2", "4"),
+    "api.mapbox.com": _limit("MAPBOX", "10", "10"),
+    "api.openai.com": _limit("OPENAI", "5", "10"),
+    "api.anthropic.com": _limit("ANTHROPIC", "5", "10"),
+}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # Waiters queue on the lock, so tokens are handed out in arrival order.
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class HostRateLimiter:
+    def __init__(self, limits: Dict[str, Tuple[float, float]]):
+        self._buckets = {
+            host: TokenBucket(rate, burst)
+            for host, (rate, burst) in limits.items()
+            if rate > 0
+        }
+
+    def bucket_for(self, url_or_host: str) -> Optional[TokenBucket]:
+        host = urlparse(url_or_host).hostname or url_or_host
+        for suffix, bucket in self._buckets.items():
+            if host == suffix or host.endswith(f".{suffix}"):
+                return bucket
+        return None
+
+    async def acquire(self, url_or_host: str):
+        bucket = self.bucket_for(url_or_host)
+        if bucket is not None:
+            await bucket.acquire()
+
+
+rate_limiter = HostRateLimiter(HOST_RATE_LIMITS)
+
+
+class RateLimitCallbackHandler(AsyncCallbackHandler):
+    """Holds every chat model call, including agent steps, until its
+    provider's bucket has a token."""
+
+    def __init__(self, host: str):
+        self.host = host
+
+    async def on_chat_model_start(self, serialized, messages, **kwargs):
+        await rate_limiter.acquire(self.host)
+
+    async def on_llm_start(self, serialized, prompts, **kwargs):
+        await rate_limiter.acquire(self.host)
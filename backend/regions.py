@@ -0,0 +1,411 @@
+import argparse
+import json
+import os
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from bs4 import BeautifulSoup
+
+REGIONS_PATH = os.path.join(os.path.dirname(__file__), "data", "regions.json")
+
+FUZZY_THRESHOLD = 0.6
+MAX_NGRAM_WORDS = 4
+# Below REQUIREMENTS_CONFIDENCE_THRESHOLD, so these matches go to the LLM
+BARE_NEIGHBORHOOD_SCORE = 0.7
+EMBEDDED_MATCH_SCORE = 0.6
+FUZZY_MAX_SCORE = 0.7
+SHORT_ALIAS_LENGTH = 2
+
+STATE_ABBREVIATIONS = {
+    "alabama": "AL", "alaska": "AK", "arizona": "AZ", "arkansas": "AR",
+    "california": "CA", "colorado": "CO", "connecticut": "CT", "delaware": "DE",
+    "district of columbia": "DC", "florida": "FL", "georgia": "GA", "hawaii": "HI",
+    "idaho": "ID", "illinois": "IL", "indiana": "IN", "iowa": "IA",
+    "kansas": "KS", "kentucky": "KY", "louisiana": "LA", "maine": "ME",
+    "maryland": "MD", "massachusetts": "MA", "michigan": "MI", "minnesota": "MN",
+    "mississippi": "MS", "missouri": "MO", "montana": "MT", "nebraska": "NE",
+    "nevada": "NV", "new hampshire": "NH", "new jersey": "NJ", "new mexico": "NM",
+    "new york": "NY", "north carolina": "NC", "north dakota": "ND", "ohio": "OH",
+    "oklahoma": "OK", "oregon": "OR", "pennsylvania": "PA", "rhode island": "RI",
+    "south carolina": "SC", "south dakota": "SD", "tennessee": "TN", "texas": "TX",
+    "utah": "UT", "vermont": "VT", "virginia": "VA", "washington": "WA",
+    "west virginia": "WV", "wisconsin": "WI", "wyoming": "WY",
+}
+
+_NON_ALNUM = re.compile(r"[^a-z0-9 ]+")
+_WHITESPACE = re.compile(r"\s+")
+_SITE_HREF = re.compile(r"^https?://([a-z0-9]+)\.craigslist\.org/?$")
+_RAW_WORD = re.compile(r"[A-Za-z0-9]+")
+
+# Words that can sit next to a place name in a request without being part
+# of it: "2br in sf under 3k", "studio near boston with parking".
+_CONNECTORS = {
+    "a", "an", "the", "in", "into", "near", "around", "at", "by", "of", "to",
+    "from", "for", "with", "within", "and", "under", "below", "over", "above",
+    "between", "less", "more", "than", "max", "min", "maximum", "minimum",
+    "up", "no", "budget", "area", "metro", "apartment", "apartments", "apt",
+    "apts", "place", "rental", "studio", "studios", "room", "house", "home",
+    "condo", "loft", "unit", "bedroom", "bedrooms", "bed", "beds", "br",
+    "bath", "baths", "ba", "pet", "pets", "dog", "cat", "furnished", "parking",
+    "laundry",
+}
+# Two-letter states that are also everyday words; lowercase, they aren't states
+_STATE_STOPWORDS = {"in", "me", "or", "ok", "oh", "hi", "id"}
+
+
+def normalize_location(text: str) -> str:
+    text = _NON_ALNUM.sub(" ", text.lower())
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def _gram_spans(length: int) -> List[Tuple[int, int]]:
+    """Word n-gram spans, longest first."""
+    return [
+        (start, start + size)
+        for size in range(min(length, MAX_NGRAM_WORDS), 0, -1)
+        for start in range(length - size + 1)
+    ]
+
+
+def _embedded(words: List[str], start: int, end: int, states: set) -> bool:
+    """Whether words[start:end] runs into other words that may belong to
+    the same place name."""
+    return any(
+        word not in _CONNECTORS
+        and not any(character.isdigit() for character in word)
+        and word.upper() not in states
+        for word in words[max(start - 1, 0) : start] + words[end : end + 1]
+    )
+
+
+@dataclass(frozen=True)
+class Region:
+    subdomain: str
+    name: str
+    state: str
+    centroid: Optional[Tuple[float, float]] = None
+    aliases: Tuple[str, ...] = ()
+    neighborhoods: Tuple[str, ...] = ()
+
+
+@dataclass(frozen=True)
+class RegionMatch:
+    region: Region
+    search_term: str = ""
+    score: float = 1.0
+
+
+@dataclass
+class RegionIndex:
+    regions: List[Region]
+    version: str = ""
+    _by_subdomain: Dict[str, Region] = field(default_factory=dict, repr=False)
+    _aliases: Dict[str, List[Region]] = field(default_factory=dict, repr=False)
+    _neighborhoods: Dict[str, List[Region]] = field(default_factory=dict, repr=False)
+    _names: List[Tuple[str, Region, bool]] = field(default_factory=list, repr=False)
+    _trigrams: Dict[str, List[int]] = field(default_factory=dict, repr=False)
+    _trigram_counts: List[int] = field(default_factory=list, repr=False)
+
+    def __post_init__(self):
+        aliases = defaultdict(list)
+        neighborhoods = defaultdict(list)
+        postings = defaultdict(list)
+
+        for region in self.regions:
+            self._by_subdomain[region.subdomain] = region
+            for alias in region.aliases:
+                aliases[alias].append(region)
+                self._names.append((alias, region, True))
+            for neighborhood in region.neighborhoods:
+                neighborhoods[neighborhood].append(region)
+                self._names.append((neighborhood, region, False))
+
+        for position, (name, _, _) in enumerate(self._names):
+            grams = trigrams(name)
+            self._trigram_counts.append(len(grams))
+            for gram in grams:
+                postings[gram].append(position)
+
+        self._aliases = dict(aliases)
+        self._neighborhoods = dict(neighborhoods)
+        self._trigrams = dict(postings)
+
+    @classmethod
+    def load(cls, path: str = REGIONS_PATH) -> "RegionIndex":
+        with open(path) as f:
+            data = json.load(f)
+
+        regions = [
+            Region(
+                subdomain=entry["subdomain"],
+                name=entry["name"],
+                state=entry.get("state") or "",
+                centroid=tuple(entry["centroid"]) if entry.get("centroid") else None,
+                aliases=tuple(entry.get("aliases") or ()),
+                neighborhoods=tuple(entry.get("neighborhoods") or ()),
+            )
+            for entry in data["regions"]
+        ]
+        return cls(regions=regions, version=data.get("version", ""))
+
+    def get(self, subdomain: str) -> Optional[Region]:
+        return self._by_subdomain.get(subdomain)
+
+    def neighborhood(self, region: Region, location: str) -> Optional[str]:
+        """The first of ``region``'s neighborhoods named in ``location``."""
+        for part in location.split(","):
+            words = normalize_location(part).split()
+            for start, end in _gram_spans(len(words)):
+                gram = " ".join(words[start:end])
+                if region in self._neighborhoods.get(gram, ()):
+                    return gram
+        return None
+
+    def lookup(self, location: str) -> Optional[RegionMatch]:
+        raw_parts = [part for part in location.split(",") if normalize_location(part)]
+        if not raw_parts:
+            return None
+        parts = [normalize_location(part) for part in raw_parts]
+        words = [part.split() for part in parts]
+        states = self._states(parts, raw_parts, location.isupper())
+
+        neighborhood_hits = [
+            (index, start, end, " ".join(words[index][start:end]))
+            for index in range(len(parts))
+            for start, end in _gram_spans(len(words[index]))
+            if " ".join(words[index][start:end]) in self._neighborhoods
+        ]
+
+        region_hit = None
+        for index, part in enumerate(parts):
+            candidates = [
+                (" ".join(words[index][start:end]), start, end)
+                for start, end in _gram_spans(len(words[index]))
+            ]
+            if index + 1 < len(parts):
+                candidates.insert(0, (f"{part} {parts[index + 1]}", 0, len(words[index])))
+            for candidate, start, end in candidates:
+                region = self._pick(self._aliases.get(candidate), states)
+                if not region or any(
+                    hit_index == index and hit_start <= start and end <= hit_end
+                    and hit_end - hit_start > end - start
+                    for hit_index, hit_start, hit_end, _ in neighborhood_hits
+                ):
+                    # "la" in "la jolla" is part of a longer place name
+                    continue
+                embedded = _embedded(words[index], start, end, states)
+                if embedded and len(candidate) <= SHORT_ALIAS_LENGTH:
+                    continue
+                if region_hit is None or (region_hit[2] and not embedded):
+                    region_hit = (index, region, embedded)
+            if region_hit and not region_hit[2]:
+                break
+
+        if region_hit:
+            index, region, embedded = region_hit
+            for _, _, _, gram in neighborhood_hits:
+                if region in self._neighborhoods[gram]:
+                    return RegionMatch(region=region, search_term=gram)
+            # "washington heights" may not be Washington at all unless a
+            # state says so.
+            score = EMBEDDED_MATCH_SCORE if embedded and not states else 1.0
+            return RegionMatch(
+                region=region, search_term=" ".join(parts[:index]), score=score
+            )
+
+        for index, start, end, gram in neighborhood_hits:
+            owners = self._neighborhoods[gram]
+            region = self._pick(owners, states)
+            if region:
+                # A neighborhood named without its city is a guess ("2br in
+                # Springfield") unless a state narrowed it down.
+                score = 1.0 if states else BARE_NEIGHBORHOOD_SCORE
+                if not states and _embedded(words[index], start, end, states):
+                    score = min(score, EMBEDDED_MATCH_SCORE)
+                return RegionMatch(region=region, search_term=gram, score=score)
+
+        return self._fuzzy_lookup(parts, states)
+
+    def _states(self, parts: List[str], raw_parts: List[str], shouting: bool) -> set:
+        """States named in ``parts``: a whole comma part after the first
+        ("Springfield, IL"), a state name ending a part ("Springfield
+        Illinois"), or an abbreviation written in capitals or ending a part
+        ("Springfield IL", "austin tx")."""
+        abbreviations = set(STATE_ABBREVIATIONS.values())
+        states = set()
+        for index, part in enumerate(parts):
+            if part in self._aliases:
+                continue
+            if index and (part in STATE_ABBREVIATIONS or part.upper() in abbreviations):
+                states.add(STATE_ABBREVIATIONS.get(part, part.upper()))
+                continue
+
+            words = part.split()
+            for size in range(min(len(words) - 1, 3), 0, -1):
+                tail = " ".join(words[-size:])
+                if tail in STATE_ABBREVIATIONS and tail not in self._aliases:
+                    states.add(STATE_ABBREVIATIONS[tail])
+                    break
+
+            raw_words = _RAW_WORD.findall(raw_parts[index])
+            for position, word in enumerate(raw_words):
+                if word.upper() not in abbreviations or word.lower() in self._aliases:
+                    continue
+                ends_part = 0 < position == len(raw_words) - 1
+                if (word.isupper() and not shouting) or (
+                    ends_part and word.lower() not in _STATE_STOPWORDS
+                ):
+                    states.add(word.upper())
+        return states
+
+    def _pick(self, regions: Optional[List[Region]], states: set) -> Optional[Region]:
+        if not regions:
+            return None
+        if states:
+            regions = [region for region in regions if region.state in states]
+        return regions[0] if regions else None
+
+    def _fuzzy_lookup(self, parts: List[str], states: set) -> Optional[RegionMatch]:
+        best = None
+        for index, part in enumerate(parts):
+            grams = trigrams(part)
+            overlap = defaultdict(int)
+            for gram in grams:
+                for position in self._trigrams.get(gram, ()):
+                    overlap[position] += 1
+
+            for position, shared in overlap.items():
+                name, region, is_alias = self._names[position]
+                if states and region.state not in states:
+                    continue
+                score = 2 * shared / (len(grams) + self._trigram_counts[position])
+                if score >= FUZZY_THRESHOLD and (best is None or score > best[0]):
+                    search_term = " ".join(parts[:index]) if is_alias else name
+                    best = (score, region, search_term)
+
+        if best is None:
+            return None
+
+        score, region, search_term = best
+        return RegionMatch(
+            region=region, search_term=search_term, score=min(score, FUZZY_MAX_SCORE)
+        )
+
+
+@lru_cache(maxsize=1)
+def get_region_index() -> RegionIndex:
+    return RegionIndex.load()
+
+
+def resolve_region(location: str) -> Optional[RegionMatch]:
+    return get_region_index().lookup(location)
+
+
+def parse_regions_page(html: str) -> List[dict]:
+    soup = BeautifulSoup(html, "html.parser")
+    regions = []
+    seen = set()
+
+    for link in soup.find_all("a", href=True):
+        match = _SITE_HREF.match(link["href"].strip())
+        if not match or match.group(1) in seen:
+            continue
+        seen.add(match.group(1))
+
+        heading = link.find_previous(["h4", "h2"])
+        state = ""
+        if heading:
+            state_name = normalize_location(heading.get_text())
+            state = STATE_ABBREVIATIONS.get(state_name, "")
+
+        regions.append(
+            {
+                "subdomain": match.group(1),
+                "name": link.get_text(strip=True),
+                "state": state,
+            }
+        )
+
+    return regions
+
+
+def refresh_regions(page_path: str, out_path: str = REGIONS_PATH) -> dict:
+    """Rebuild the region table from a saved copy of geo.craigslist.org/iso/us.
+
+    Centroids, aliases and neighborhoods are carried over from the current
+    table for regions that still exist; new regions get their display name
+    as their only alias.
+    """
+    with open(page_path) as f:
+        scraped = parse_regions_page(f.read())
+
+    existing = {}
+    if os.path.exists(out_path):
+        with open(out_path) as f:
+            existing = {entry["subdomain"]: entry for entry in json.load(f)["regions"]}
+
+    regions = []
+    for entry in scraped:
+        previous = existing.get(entry["subdomain"], {})
+        regions.append(
+            {
+                "subdomain": entry["subdomain"],
+                "name": entry["name"],
+                "state": entry["state"] or previous.get("state", ""),
+                "centroid": previous.get("centroid"),
+                "aliases": previous.get("aliases")
+                or [normalize_location(entry["name"])],
+                "neighborhoods": previous.get("neighborhoods", []),
+            }
+        )
+
+    table = {
+        "version": date.today().isoformat(),
+        "source": "https://geo.craigslist.org/iso/us",
+        "regions": regions,
+    }
+
+    with open(out_path, "w") as f:
+        json.dump(table, f, indent=2)
+        f.write("\n")
+
+    get_region_index.cache_clear()
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Craigslist region table tools")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+
+    refresh = subcommands.add_parser(
+        "refresh", help="rebuild the region table from a saved regions page"
+    )
+    refresh.add_argument("page", help="saved HTML of geo.craigslist.org/iso/us")
+    refresh.add_argument("--out", default=REGIONS_PATH)
+
+    lookup = subcommands.add_parser("lookup", help="resolve a location string")
+    lookup.add_argument("location")
+
+    args = parser.parse_args()
+
+    if args.command == "refresh":
+        table = refresh_regions(args.page, args.out)
+        print(f"wrote {len(table['regions'])} regions ({table['version']}) to {args.out}")
+    else:
+        match = resolve_region(args.location)
+        if match is None:
+            print("no match")
+        else:
+            print(
+                f"{match.region.subdomain} ({match.region.name}, {match.region.state}) "
+                f"search_term={match.search_term!r} score={match.score:.2f}"
+            )
@@ -0,0 +1,215 @@
+import os
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+from models import Requirements
+from regions import resolve_region
+
+REQUIREMENTS_CONFIDENCE_THRESHOLD = float(
+    os.environ.get("REQUIREMENTS_CONFIDENCE_THRESHOLD", "0.8")
+)
+
+_NUMBER_WORDS = {
+    "one": "1", "two": "2", "three": "3", "four": "4", "five": "5", "six": "6",
+    "a": "1", "single": "1",
+}
+_NUMBER = r"(\d+(?:\.\d+)?|one|two|three|four|five|six|a|single)"
+_MONEY = r"\$?\s*(\d[\d,]*(?:\.\d+)?)\s*(k)?"
+_BEDS = r"(?:br|bd|bdr|bdrm|beds?|bedrooms?|b/r)\b"
+_BATHS = r"(?:ba|bth|baths?|bathrooms?)\b"
+
+_PRICE_RANGE = re.compile(
+    rf"(?:between\s+)?\${_MONEY[3:]}\s*(?:-|–|to|and)\s*{_MONEY}", re.IGNORECASE
+)
+_PRICE_MAX = re.compile(
+    rf"(?:under|below|less than|max(?:imum)?(?: of)?|up to|no more than|budget(?: of| is)?|<=?)\s*{_MONEY}",
+    re.IGNORECASE,
+)
+_PRICE_MIN = re.compile(
+    rf"(?:at least|over|above|more than|min(?:imum)?(?: of)?|from|>=?)\s*{_MONEY}",
+    re.IGNORECASE,
+)
+_STUDIO = re.compile(r"\bstudios?\b", re.IGNORECASE)
+
+
+@dataclass(frozen=True)
+class _CountRules:
+    range: re.Pattern
+    min: re.Pattern
+    # "more than 1 bedroom" excludes 1, so it starts one step up
+    strict_min: re.Pattern
+    max: re.Pattern
+    strict_max: re.Pattern
+    exact: re.Pattern
+    step: float
+
+
+def _count_rule(unit: str, step: float) -> _CountRules:
+    count = rf"{_NUMBER}[\s-]*{unit}"
+    return _CountRules(
+        range=re.compile(rf"\b{_NUMBER}\s*(?:-|–|to|or)\s*{count}", re.IGNORECASE),
+        min=re.compile(
+            rf"(?:at least|minimum(?: of)?|min)\s+{count}|\b{_NUMBER}\s*\+\s*{unit}"
+            rf"|\b{_NUMBER}\s+or more[\s-]*{unit}|\b{count}\s+or more\b",
+            re.IGNORECASE,
+        ),
+        strict_min=re.compile(
+            rf"(?<!no )(?:more than|greater than|over|above)\s+{count}", re.IGNORECASE
+        ),
+        max=re.compile(
+            rf"(?:no more than|at most|up to|maximum(?: of)?|max)\s+{count}"
+            rf"|\b{count}\s+or (?:less|fewer)\b",
+            re.IGNORECASE,
+        ),
+        strict_max=re.compile(
+            rf"(?:less than|fewer than|under|below)\s+{count}", re.IGNORECASE
+        ),
+        exact=re.compile(rf"\b{count}", re.IGNORECASE),
+        step=step,
+    )
+
+
+_BEDROOM_RULES = _count_rule(_BEDS, 1)
+# Half baths are listed, so "more than 1 bath" means at least 1.5
+_BATHROOM_RULES = _count_rule(_BATHS, 0.5)
+
+# Phrasings the rules don't model; their presence means the LLM should decide.
+_AMBIGUOUS = re.compile(
+    r"(?<!,\s)\b(?:or|commute|minutes?|walking distance|close to|except|not in|per person|per room)\b",
+    re.IGNORECASE,
+)
+_DIGIT = re.compile(r"\d")
+
+
+@dataclass
+class ParsedRequirements:
+    requirements: Requirements
+    confidence: float
+
+
+def _number(text: str) -> float:
+    return float(_NUMBER_WORDS.get(text.lower(), text))
+
+
+def _money(amount: str, thousands: Optional[str]) -> int:
+    value = float(amount.replace(",", ""))
+    if thousands:
+        value *= 1000
+    return int(value)
+
+
+def _first(pattern: re.Pattern, text: str, spans: List[Tuple[int, int]], accept=None):
+    for match in pattern.finditer(text):
+        if any(start < match.end() and match.start() < end for start, end in spans):
+            continue
+        if accept is not None and not accept(match):
+            continue
+        spans.append(match.span())
+        return match
+    return None
+
+
+def _is_rent(match: re.Match) -> bool:
+    # "up to 2 bedrooms" must not read as a $2 budget
+    return all(
+        _money(amount, thousands) >= 100
+        for amount, thousands in zip(match.groups()[::2], match.groups()[1::2])
+    )
+
+
+def _matched_number(match: re.Match) -> float:
+    return _number(next(group for group in match.groups() if group is not None))
+
+
+def _parse_counts(rules: _CountRules, text: str, spans: List[Tuple[int, int]]):
+    match = _first(rules.range, text, spans)
+    if match:
+        return _number(match.group(1)), _number(match.group(2))
+
+    match = _first(rules.min, text, spans)
+    if match:
+        return _matched_number(match), None
+
+    match = _first(rules.strict_min, text, spans)
+    if match:
+        return _matched_number(match) + rules.step, None
+
+    match = _first(rules.max, text, spans)
+    if match:
+        return None, _matched_number(match)
+
+    match = _first(rules.strict_max, text, spans)
+    if match:
+        return None, max(_matched_number(match) - rules.step, 0)
+
+    match = _first(rules.exact, text, spans)
+    if match:
+        value = _number(match.group(1))
+        return value, value
+
+    return None, None
+
+
+def _parse_price(text: str, spans: List[Tuple[int, int]]):
+    match = _first(_PRICE_RANGE, text, spans, _is_rent)
+    if match:
+        return _money(match.group(1), match.group(2)), _money(match.group(3), match.group(4))
+
+    match = _first(_PRICE_MAX, text, spans, _is_rent)
+    if match:
+        return 0, _money(match.group(1), match.group(2))
+
+    match = _first(_PRICE_MIN, text, spans, _is_rent)
+    if match:
+        return _money(match.group(1), match.group(2)), None
+
+    return None, None
+
+
+def parse_requirements(description: str) -> ParsedRequirements:
+    """Extract requirements with the phrasings documented in
+    parse_preferences_instructions, without calling a model."""
+    text = description.strip()
+    spans: List[Tuple[int, int]] = []
+
+    min_price, max_price = _parse_price(text, spans)
+
+    if _STUDIO.search(text):
+        min_bedrooms = max_bedrooms = 0
+    else:
+        min_bedrooms, max_bedrooms = _parse_counts(_BEDROOM_RULES, text, spans)
+
+    min_bathrooms, max_bathrooms = _parse_counts(_BATHROOM_RULES, text, spans)
+
+    match = resolve_region(text)
+    location = ""
+    confidence = 0.0
+
+    if match is not None:
+        region = match.region
+        city = (region.aliases[0] if region.aliases else region.name).title()
+        location = f"{match.search_term.title()}, {city}" if match.search_term else city
+        confidence = match.score
+
+        # Numbers the rules didn't consume (street numbers, dates, sqft...)
+        # mean part of the request wasn't understood.
+        leftover = list(text)
+        for start, end in spans:
+            leftover[start:end] = " " * (end - start)
+        unexplained = len(_DIGIT.findall("".join(leftover)))
+        if unexplained:
+            confidence -= 0.3
+        if _AMBIGUOUS.search(text):
+            confidence -= 0.3
+
+    requirements = Requirements(
+        location=location,
+        min_price=min_price,
+        max_price=max_price,
+        min_bedrooms=int(min_bedrooms) if min_bedrooms is not None else None,
+        max_bedrooms=int(max_bedrooms) if max_bedrooms is not None else None,
+        min_bathrooms=min_bathrooms,
+        max_bathrooms=max_bathrooms,
+    )
+    return ParsedRequirements(requirements=requirements, confidence=max(confidence, 0.0))
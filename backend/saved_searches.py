@@ -0,0 +1,273 @@
+import json
+import os
+import threading
+import time
+import uuid
+from dataclasses import asdict, dataclass, field
+from typing import List, Optional, Tuple
+
+from graph import get_apartment_finder_graph
+from image_proxy import proxied_listing
+from http_client import fetch_html
+from models import Requirements, SearchResults
+from parsers import parse_search_results
+from storage import EventLog, connect, fetch_returning
+
+SAVED_SEARCH_INTERVAL_SECONDS = float(
+    os.environ.get("SAVED_SEARCH_INTERVAL_SECONDS", "3600")
+)
+SAVED_SEARCH_MIN_INTERVAL_SECONDS = float(
+    os.environ.get("SAVED_SEARCH_MIN_INTERVAL_SECONDS", "300")
+)
+
+
+@dataclass
+class SavedSearch:
+    id: str
+    request: dict
+    requirements: Requirements
+    search_url: str
+    interval_seconds: float
+    created_at: float
+    next_poll_at: float
+    last_polled_at: Optional[float] = None
+    # Every card at or below this Craigslist post ID has been handled. Post
+    # IDs only grow, so anything above it is new unless it is listed in
+    # tried_post_ids: cards a capped poll already tried while older new
+    # cards were left for the next poll.
+    high_water: int = 0
+    polls: int = 0
+    listings_sent: int = 0
+    tried_post_ids: List[int] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+_COLUMNS = (
+    "id, request, requirements, search_url, interval_seconds, created_at,"
+    " next_poll_at, last_polled_at, high_water, polls, listings_sent, tried_post_ids"
+)
+
+
+def _saved_search(row) -> SavedSearch:
+    return SavedSearch(
+        row[0], json.loads(row[1]), json.loads(row[2]), *row[3:-1], json.loads(row[-1])
+    )
+
+
+class SavedSearchStore:
+    """Saved searches, their high-water marks and the events they produced."""
+
+    def __init__(self, filename: str = "saved_searches.sqlite3"):
+        self._lock = threading.Lock()
+        self._db = connect(filename)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS saved_searches ("
+            " id TEXT PRIMARY KEY,"
+            " request TEXT NOT NULL,"
+            " requirements TEXT NOT NULL,"
+            " search_url TEXT NOT NULL,"
+            " interval_seconds REAL NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " next_poll_at REAL NOT NULL,"
+            " last_polled_at REAL,"
+            " high_water INTEGER NOT NULL DEFAULT 0,"
+            " polls INTEGER NOT NULL DEFAULT 0,"
+            " listings_sent INTEGER NOT NULL DEFAULT 0,"
+            " tried_post_ids TEXT NOT NULL DEFAULT '[]')"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(saved_searches)")}
+        if "tried_post_ids" not in columns:
+            self._db.execute(
+                "ALTER TABLE saved_searches"
+                " ADD COLUMN tried_post_ids TEXT NOT NULL DEFAULT '[]'"
+            )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS saved_searches_due ON saved_searches (next_poll_at)"
+        )
+        self._events = EventLog(self._db, self._lock, "saved_search_events", "search_id")
+
+    def create(
+        self,
+        request: dict,
+        requirements: Requirements,
+        search_url: str,
+        interval_seconds: float = SAVED_SEARCH_INTERVAL_SECONDS,
+    ) -> SavedSearch:
+        now = time.time()
+        saved = SavedSearch(
+            id=uuid.uuid4().hex,
+            request=request,
+            requirements=requirements,
+            search_url=search_url,
+            interval_seconds=max(interval_seconds, SAVED_SEARCH_MIN_INTERVAL_SECONDS),
+            created_at=now,
+            # The first poll is the initial search
+            next_poll_at=now,
+        )
+        with self._lock:
+            self._db.execute(
+                f"INSERT INTO saved_searches ({_COLUMNS})"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    saved.id,
+                    json.dumps(request),
+                    json.dumps(requirements),
+                    saved.search_url,
+                    saved.interval_seconds,
+                    saved.created_at,
+                    saved.next_poll_at,
+                    saved.last_polled_at,
+                    saved.high_water,
+                    saved.polls,
+                    saved.listings_sent,
+                    json.dumps(saved.tried_post_ids),
+                ),
+            )
+        return saved
+
+    def get(self, search_id: str) -> Optional[SavedSearch]:
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT {_COLUMNS} FROM saved_searches WHERE id = ?", (search_id,)
+            ).fetchone()
+        return _saved_search(row) if row else None
+
+    def list(self) -> List[SavedSearch]:
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {_COLUMNS} FROM saved_searches ORDER BY created_at"
+            ).fetchall()
+        return [_saved_search(row) for row in rows]
+
+    def delete(self, search_id: str) -> bool:
+        with self._lock:
+            deleted = self._db.execute(
+                "DELETE FROM saved_searches WHERE id = ?", (search_id,)
+            ).rowcount
+            self._events.delete(search_id)
+        return bool(deleted)
+
+    def claim_due(self) -> Optional[SavedSearch]:
+        """Take the most overdue search, pushing its next poll out by its
+        interval so no other worker picks it up meanwhile."""
+        now = time.time()
+        with self._lock:
+            row = fetch_returning(
+                self._db,
+                "UPDATE saved_searches SET next_poll_at = ? + interval_seconds"
+                " WHERE id = ("
+                "  SELECT id FROM saved_searches WHERE next_poll_at <= ?"
+                "  ORDER BY next_poll_at LIMIT 1)"
+                f" RETURNING {_COLUMNS}",
+                (now, now),
+            )
+        return _saved_search(row) if row else None
+
+    def record_poll(
+        self,
+        search_id: str,
+        high_water: int,
+        tried_post_ids: List[int],
+        listings_sent: int,
+    ):
+        with self._lock:
+            self._db.execute(
+                "UPDATE saved_searches SET high_water = MAX(high_water, ?),"
+                " tried_post_ids = ?, last_polled_at = ?, polls = polls + 1,"
+                " listings_sent = listings_sent + ?"
+                " WHERE id = ?",
+                (high_water, json.dumps(tried_post_ids), time.time(), listings_sent, search_id),
+            )
+
+    def append_event(self, search_id: str, event: dict) -> int:
+        return self._events.append(search_id, event)
+
+    def events(self, search_id: str, after: int = 0) -> List[Tuple[int, str]]:
+        return self._events.events(search_id, after)
+
+
+_store: Optional[SavedSearchStore] = None
+
+
+def get_saved_search_store() -> SavedSearchStore:
+    global _store
+    if _store is None:
+        _store = SavedSearchStore()
+    return _store
+
+
+def _post_id(listing) -> int:
+    return int(listing.post_id) if listing.post_id and listing.post_id.isdigit() else 0
+
+
+async def poll_saved_search(store: SavedSearchStore, saved: SavedSearch) -> int:
+    """Fetch the first result page and run only unseen posts through the
+    listing stage, publishing each new listing as an event.
+
+    Costs one page fetch when nothing is new; the requirements and search URL
+    are never re-derived. A poll stops after ``max_listings`` listings like a
+    search does; new cards it didn't get to are picked up by the next poll.
+    """
+    html = await fetch_html(saved.search_url)
+    cards = parse_search_results(html, saved.search_url) if html else []
+    tried = set(saved.tried_post_ids)
+    new_cards = [
+        card
+        for card in cards
+        if _post_id(card) > saved.high_water and _post_id(card) not in tried
+    ]
+
+    sent = 0
+    if new_cards:
+        request = saved.request
+        graph = get_apartment_finder_graph(
+            executor_model=request["executor"],
+            planner_model=request["planner"],
+            headless_mode=request["headless_mode"],
+        )
+        config = {
+            "configurable": {
+                "max_listings": request["max_listings"],
+                "search_agent_fallback": request["search_agent_fallback"],
+                "max_concurrency": request["max_concurrency"],
+                "extraction_mode": request.get("extraction_mode", "vision"),
+            }
+        }
+        state = {
+            "user_description": request["description"],
+            "requirements": saved.requirements,
+            "search_results": SearchResults(listings=new_cards),
+        }
+        async for mode, chunk in graph.astream(
+            state, config, stream_mode=["custom", "values"]
+        ):
+            if mode == "custom" and "listing" in chunk:
+                store.append_event(
+                    saved.id, {"type": "listing", "data": proxied_listing(chunk["listing"])}
+                )
+                sent += 1
+            elif mode == "values":
+                tried.update(
+                    int(post_id)
+                    for post_id in chunk.get("attempted_post_ids") or []
+                    if post_id.isdigit()
+                )
+
+    # The mark only passes cards that were tried, so a card the listing stage
+    # never reached is still new next time.
+    untried = [_post_id(card) for card in new_cards if _post_id(card) not in tried]
+    if untried:
+        high_water = max(saved.high_water, min(untried) - 1)
+    else:
+        high_water = max([saved.high_water] + [_post_id(card) for card in cards])
+
+    store.record_poll(
+        saved.id, high_water, sorted(post_id for post_id in tried if post_id > high_water), sent
+    )
+    store.append_event(
+        saved.id,
+        {"type": "poll", "new": sent, "seen": len(cards), "polled_at": time.time()},
+    )
+    return sent
@@ -0,0 +1,93 @@
+import asyncio
+import itertools
+import os
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Iterable,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+MAX_LISTING_CONCURRENCY = int(os.environ.get("MAX_LISTING_CONCURRENCY", "5"))
+
+
+async def _aiter(items: Union[Iterable[T], AsyncIterable[T]]) -> AsyncIterator[T]:
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+async def schedule(
+    items: Union[Iterable[T], AsyncIterable[T]],
+    worker: Callable[[T], Awaitable[R]],
+    concurrency: int = MAX_LISTING_CONCURRENCY,
+    limit: Optional[int] = None,
+) -> AsyncIterator[Tuple[int, T, Union[R, Exception]]]:
+    """Run ``worker`` over ``items`` with at most ``concurrency`` in flight.
+
+    Items are started in priority order (their position in ``items``, so top
+    search results go first) and yielded as ``(priority, item, result)`` in
+    completion order. A worker that raises yields the exception as its result.
+
+    ``items`` may be an async iterable; it is only pulled when a worker is
+    free, so a lazy source is never read more than ``concurrency`` items
+    ahead of the results. Close the generator early to stop pulling. At most
+    ``limit`` items are started.
+    """
+    source = _aiter(items)
+    source_lock = asyncio.Lock()
+    priorities = itertools.count()
+    started = 0
+    finished: asyncio.Queue = asyncio.Queue()
+
+    async def take():
+        nonlocal started
+        async with source_lock:
+            if limit is not None and started >= limit:
+                return None
+            try:
+                item = await source.__anext__()
+            except StopAsyncIteration:
+                return None
+            started += 1
+            return next(priorities), item
+
+    async def run():
+        while (entry := await take()) is not None:
+            priority, item = entry
+            try:
+                result = await worker(item)
+            except Exception as e:
+                result = e
+            await finished.put((priority, item, result))
+
+    runners = [asyncio.create_task(run()) for _ in range(max(1, concurrency))]
+    for runner in runners:
+        runner.add_done_callback(lambda _: finished.put_nowait(None))
+
+    try:
+        active = len(runners)
+        while active:
+            entry = await finished.get()
+            if entry is None:
+                active -= 1
+            else:
+                yield entry
+        for runner in runners:
+            runner.result()
+    finally:
+        for runner in runners:
+            runner.cancel()
+        await asyncio.gather(*runners, return_exceptions=True)
+        await source.aclose()
@@ -0,0 +1,181 @@
+import asyncio
+import os
+import time
+from typing import AsyncIterator, Awaitable, Callable, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+from graph import get_apartment_finder_graph
+from image_proxy import proxied_listing
+from metrics import search_timing, start_search_timing, track_search_run
+from models import Requirements
+from scheduler import MAX_LISTING_CONCURRENCY
+
+CANCEL_POLL_SECONDS = float(os.environ.get("CANCEL_POLL_SECONDS", "1.0"))
+
+
+class SearchRequest(BaseModel):
+    description: str
+    planner: str
+    executor: str
+    headless_mode: bool
+    max_listings: int = 10
+    search_agent_fallback: bool = False
+    max_concurrency: int = Field(MAX_LISTING_CONCURRENCY, ge=1, le=50)
+    # "text" sends agents a pruned DOM snapshot instead of screenshots
+    extraction_mode: Literal["vision", "text"] = "vision"
+
+
+async def cancel_when(stream, should_cancel: Optional[Callable[[], Awaitable[bool]]]):
+    """Drive ``stream`` in its own task, cancelling it once ``should_cancel``
+    returns True (the client went away, the job was cancelled...).
+
+    Cancellation propagates into the graph run, so agents, browser contexts
+    and LLM calls are torn down instead of finishing for nobody.
+    """
+    events = asyncio.Queue()
+    done = object()
+
+    async def produce():
+        async for event in stream:
+            await events.put(event)
+
+    runner = asyncio.create_task(produce())
+    track_search_run(runner)
+    runner.add_done_callback(lambda _: events.put_nowait(done))
+
+    async def watch():
+        while not runner.done():
+            if await should_cancel():
+                runner.cancel()
+                return
+            await asyncio.sleep(CANCEL_POLL_SECONDS)
+
+    watcher = asyncio.create_task(watch()) if should_cancel else None
+    try:
+        while (event := await events.get()) is not done:
+            yield event
+        if not runner.cancelled():
+            runner.result()
+    finally:
+        # Also covers the consumer closing this generator early
+        runner.cancel()
+        if watcher is not None:
+            watcher.cancel()
+
+
+async def search_events(
+    request: SearchRequest,
+    should_cancel: Optional[Callable[[], Awaitable[bool]]] = None,
+    requirements: Optional[Requirements] = None,
+) -> AsyncIterator[dict]:
+    """Run a search and yield the events the UI consumes, as plain dicts.
+
+    Pass ``requirements`` when they are already resolved to skip that step;
+    the caller then starts the search timing before resolving them.
+    """
+    graph = get_apartment_finder_graph(
+        executor_model=request.executor,
+        planner_model=request.planner,
+        headless_mode=request.headless_mode,
+    )
+    config = {
+        "configurable": {
+            "max_listings": request.max_listings,
+            "search_agent_fallback": request.search_agent_fallback,
+            "max_concurrency": request.max_concurrency,
+            "extraction_mode": request.extraction_mode,
+        }
+    }
+
+    if requirements is None:
+        start_search_timing()
+
+    state = {"user_description": request.description}
+    if requirements is not None:
+        state["requirements"] = requirements
+    else:
+        # Initial status message
+        yield {"type": "status", "message": "🏠 gathering requirements..."}
+
+    # Set to track which status messages have been sent
+    sent_messages = set()
+
+    started = time.perf_counter()
+    first_listing_at = None
+    listing_count = 0
+    merged_post_ids = {}
+
+    async for mode, chunk in cancel_when(
+        graph.astream(
+            state,
+            config,
+            stream_mode=["values", "custom"],
+        ),
+        should_cancel,
+    ):
+        # Listings are streamed one at a time as soon as each one finishes
+        if mode == "custom":
+            if "listing" in chunk:
+                if "geocoded_listings" not in sent_messages:
+                    sent_messages.add("geocoded_listings")
+                    yield {"type": "status", "message": "🏢 mapping listings..."}
+
+                if first_listing_at is None:
+                    first_listing_at = time.perf_counter()
+                listing_count += 1
+
+                yield {"type": "listing", "data": proxied_listing(chunk["listing"])}
+            continue
+
+        merged_post_ids = chunk.get("merged_post_ids") or merged_post_ids
+
+        # Process requirements
+        if "requirements" in chunk and "requirements" not in sent_messages:
+            sent_messages.add("requirements")
+            yield {"type": "status", "message": "🔍 browsing craigslist..."}
+
+        # Process search results
+        if (
+            "search_results" in chunk
+            and hasattr(chunk["search_results"], "listings")
+            and "search_results" not in sent_messages
+        ):
+            sent_messages.add("search_results")
+            yield {"type": "status", "message": "📋 inspecting listings..."}
+
+            listing_urls = []
+            for listing in chunk["search_results"].listings:
+                if hasattr(listing, "url"):
+                    listing_urls.append(listing.url)
+                elif hasattr(listing, "model_dump"):
+                    listing_data = listing.model_dump()
+                    if "url" in listing_data:
+                        listing_urls.append(listing_data["url"])
+
+            yield {
+                "type": "search_results",
+                "count": len(chunk["search_results"].listings),
+                "urls": listing_urls,
+            }
+
+        await asyncio.sleep(0.05)
+
+    if should_cancel is not None and await should_cancel():
+        return
+
+    yield {
+        "type": "summary",
+        "count": listing_count,
+        "duration_seconds": round(time.perf_counter() - started, 3),
+        "time_to_first_listing_seconds": (
+            round(first_listing_at - started, 3) if first_listing_at else None
+        ),
+        "merged_post_ids": merged_post_ids,
+    }
+
+    yield {
+        "type": "complete",
+        "message": "✅ search completed successfully!",
+        "timing": search_timing(),
+    }
@@ -0,0 +1,55 @@
+import os
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from models import Requirements
+from regions import resolve_region
+
+SEARCH_URL_TEMPLATE = os.environ.get(
+    "CRAIGSLIST_SEARCH_URL_TEMPLATE", "https://{region}.craigslist.org/search/apa"
+)
+
+
+def build_search_url(
+    requirements: Requirements,
+    region: Optional[str] = None,
+    query: Optional[str] = None,
+) -> Optional[str]:
+    if region is None:
+        match = resolve_region(requirements.get("location") or "")
+        if match is None:
+            return None
+        region = match.region.subdomain
+        if query is None:
+            query = match.search_term
+
+    params = {}
+    for key in (
+        "min_price",
+        "max_price",
+        "min_bedrooms",
+        "max_bedrooms",
+        "min_bathrooms",
+        "max_bathrooms",
+    ):
+        value = requirements.get(key)
+        if value is not None:
+            if isinstance(value, float) and value.is_integer():
+                value = int(value)
+            params[key] = value
+
+    params["hasPic"] = 1
+
+    if query:
+        params["query"] = query
+
+    return f"{SEARCH_URL_TEMPLATE.format(region=region)}?{urlencode(params)}"
+
+
+def page_url(url: str, offset: int) -> str:
+    """Return ``url`` pointed at the result page starting at ``offset``."""
+    parts = urlsplit(url)
+    params = [(key, value) for key, value in parse_qsl(parts.query) if key != "s"]
+    if offset:
+        params.append(("s", offset))
+    return urlunsplit(parts._replace(query=urlencode(params)))
@@ -0,0 +1,81 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Tuple
+
+DATA_DIR = os.environ.get("DATA_DIR", os.path.join(os.path.dirname(__file__), ".data"))
+
+
+def data_path(filename: str) -> str:
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, filename)
+
+
+def connect(filename: str) -> sqlite3.Connection:
+    connection = sqlite3.connect(
+        data_path(filename), check_same_thread=False, isolation_level=None
+    )
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    return connection
+
+
+def fetch_returning(connection: sqlite3.Connection, sql: str, params: tuple):
+    """Run a statement with a RETURNING clause and return its first row."""
+    # Exhaust RETURNING cursors so the write is finished and its lock released
+    rows = connection.execute(sql, params).fetchall()
+    return rows[0] if rows else None
+
+
+class EventLog:
+    """JSON events numbered per owner (a job, a saved search...), so a
+    client can resume after the last one it saw.
+
+    Shares its owner's connection and lock.
+    """
+
+    def __init__(
+        self,
+        connection: sqlite3.Connection,
+        lock: threading.Lock,
+        table: str,
+        owner_column: str,
+    ):
+        self._db = connection
+        self._lock = lock
+        self._table = table
+        self._owner = owner_column
+        self._db.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            f" {owner_column} TEXT NOT NULL,"
+            " seq INTEGER NOT NULL,"
+            " event TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            f" PRIMARY KEY ({owner_column}, seq))"
+        )
+
+    def append(self, owner_id: str, event: dict) -> int:
+        with self._lock:
+            row = fetch_returning(
+                self._db,
+                f"INSERT INTO {self._table} ({self._owner}, seq, event, created_at)"
+                f" SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ? FROM {self._table}"
+                f" WHERE {self._owner} = ? RETURNING seq",
+                (owner_id, json.dumps(event), time.time(), owner_id),
+            )
+        return row[0]
+
+    def events(self, owner_id: str, after: int = 0) -> List[Tuple[int, str]]:
+        """Events after sequence number ``after``, as (seq, json) pairs."""
+        with self._lock:
+            return self._db.execute(
+                f"SELECT seq, event FROM {self._table}"
+                f" WHERE {self._owner} = ? AND seq > ? ORDER BY seq",
+                (owner_id, after),
+            ).fetchall()
+
+    def delete(self, owner_id: str):
+        """Drop ``owner_id``'s events; the caller holds the lock."""
+        self._db.execute(f"DELETE FROM {self._table} WHERE {self._owner} = ?", (owner_id,))
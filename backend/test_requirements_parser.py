@@ -0,0 +1,41 @@
+import pytest
+
+from requirements_parser import REQUIREMENTS_CONFIDENCE_THRESHOLD, parse_requirements
+
+
+@pytest.mark.parametrize(
+    "description, field, expected",
+    [
+        ("more than 1 bedroom in sf", "bedrooms", (2, None)),
+        ("over 2 bedrooms in seattle", "bedrooms", (3, None)),
+        ("2br in san francisco over 2 bathrooms", "bathrooms", (2.5, None)),
+        ("2 or more bedrooms in sf", "bedrooms", (2, None)),
+        ("2 bedrooms or more in sf", "bedrooms", (2, None)),
+        ("no more than 1 bath in sf", "bathrooms", (None, 1)),
+        ("fewer than 3 bedrooms in sf", "bedrooms", (None, 2)),
+        ("at least 2br in sf", "bedrooms", (2, None)),
+        ("2-3 br in sf", "bedrooms", (2, 3)),
+        ("1 bedroom 1 bath in sf under $3k", "bathrooms", (1, 1)),
+    ],
+)
+def test_count_phrasings(description, field, expected):
+    requirements = parse_requirements(description).requirements
+    assert (requirements[f"min_{field}"], requirements[f"max_{field}"]) == expected
+
+
+@pytest.mark.parametrize("description", ["2br in Springfield", "2br in brooklyn"])
+def test_bare_neighborhood_goes_to_llm(description):
+    assert parse_requirements(description).confidence < REQUIREMENTS_CONFIDENCE_THRESHOLD
+
+
+@pytest.mark.parametrize(
+    "description, location",
+    [
+        ("2br in Brooklyn NY", "Brooklyn, New York"),
+        ("capitol hill seattle", "Capitol Hill, Seattle"),
+    ],
+)
+def test_neighborhood_with_city_or_state(description, location):
+    parsed = parse_requirements(description)
+    assert parsed.requirements["location"] == location
+    assert parsed.confidence >= REQUIREMENTS_CONFIDENCE_THRESHOLD
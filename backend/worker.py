@@ -0,0 +1,161 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+from typing import List, Optional, Set
+
+from browser_pool import close_browser_pools
+from http_client import close_http_client
+from jobs import (
+    CANCELLED,
+    CANCELLING,
+    COMPLETED,
+    FAILED,
+    JOB_POLL_SECONDS,
+    Job,
+    JobStore,
+    get_job_store,
+)
+from parsers import parse_post_id
+from search_events import SearchRequest, search_events
+from saved_searches import get_saved_search_store, poll_saved_search
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_SHUTDOWN_SECONDS = float(os.environ.get("JOB_SHUTDOWN_SECONDS", "10"))
+
+
+def _listing_post_id(event: dict) -> Optional[str]:
+    return parse_post_id(event["data"]["listing_details"]["url"])
+
+
+def _delivered_post_ids(store: JobStore, job_id: str) -> Set[str]:
+    post_ids = set()
+    for _, data in store.events(job_id):
+        event = json.loads(data)
+        if event["type"] == "listing":
+            post_ids.add(_listing_post_id(event))
+    return post_ids
+
+
+async def run_job(store: JobStore, job: Job):
+    request = SearchRequest.model_validate(job.request)
+
+    async def should_cancel():
+        return store.heartbeat(job.id) == CANCELLING
+
+    delivered = set()
+    if job.attempts > 1:
+        # Clients replay every stored event, so listings an earlier attempt
+        # already sent must not be sent again.
+        delivered = _delivered_post_ids(store, job.id)
+        store.append_event(
+            job.id, {"type": "status", "message": "♻️ resuming after a worker restart..."}
+        )
+
+    try:
+        async for event in search_events(request, should_cancel):
+            if event["type"] == "listing":
+                post_id = _listing_post_id(event)
+                if post_id is not None and post_id in delivered:
+                    continue
+                delivered.add(post_id)
+            store.append_event(job.id, event)
+    except asyncio.CancelledError:
+        # This worker is shutting down; leave the job for the next one
+        store.requeue(job.id)
+        raise
+    except Exception as e:
+        store.append_event(job.id, {"type": "error", "message": str(e)})
+        store.finish(job.id, FAILED, str(e))
+        return
+
+    if store.heartbeat(job.id) == CANCELLING:
+        store.append_event(job.id, {"type": "cancelled", "message": "search cancelled"})
+        store.finish(job.id, CANCELLED)
+    else:
+        store.finish(job.id, COMPLETED)
+
+
+async def work(worker_id: str):
+    store = get_job_store()
+    saved_searches = get_saved_search_store()
+    while True:
+        job = store.claim(worker_id)
+        if job is not None:
+            await run_job(store, job)
+            continue
+
+        # Saved-search polls only run when no interactive search is waiting
+        saved = saved_searches.claim_due()
+        if saved is not None:
+            try:
+                await poll_saved_search(saved_searches, saved)
+            except Exception as e:
+                saved_searches.append_event(saved.id, {"type": "error", "message": str(e)})
+            continue
+
+        await asyncio.sleep(JOB_POLL_SECONDS)
+
+
+async def serve(worker_id: str):
+    task = asyncio.current_task()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, task.cancel)
+
+    try:
+        await work(worker_id)
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await close_browser_pools()
+        await close_http_client()
+
+
+def run_worker(worker_id: str):
+    asyncio.run(serve(worker_id))
+
+
+def start_workers(count: int = JOB_WORKERS) -> List[multiprocessing.Process]:
+    """Start ``count`` worker processes that execute queued search jobs.
+
+    Each worker has its own event loop, browser pool and HTTP client, so
+    Chromium and page parsing never compete with the API's event loop.
+    """
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for index in range(count):
+        process = context.Process(
+            target=run_worker,
+            args=(f"{os.getpid()}-{index}",),
+            name=f"search-worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        processes.append(process)
+    return processes
+
+
+def stop_workers(processes: List[multiprocessing.Process]):
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        process.join(JOB_SHUTDOWN_SECONDS)
+        if process.is_alive():
+            process.kill()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run search job workers")
+    parser.add_argument("--workers", type=int, default=JOB_WORKERS)
+    args = parser.parse_args()
+
+    processes = start_workers(args.workers)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        stop_workers(processes)
@@ -17,6 +17,10 @@ type Listing = {
   coordinates: number[];
 };
 
+// Photos served by the backend image proxy also come in a small variant
+const thumbnailUrl = (url: string) =>
+  url.includes("/api/images/") ? `${url}?size=thumb` : url;
+
 export async function action({ request }: ActionFunctionArgs) {
   const formData = await request.formData();
   const description = formData.get("description") as string;
@@ -141,6 +145,9 @@ export default function Index() {
                     setListingUrls(data.urls);
                   }
                   break;
+                case "listing":
+                  setGeocodedListings(prev => [...prev, data.data]);
+                  break;
                 case "listings":
                   setGeocodedListings(data.data);
                   break;
@@ -288,7 +295,7 @@ export default function Index() {
           <div class="listing-popup-content">
             <div class="listing-popup-image">
               ${listing.listing_details.images && listing.listing_details.images.length > 0
-              ? `<img src="${listing.listing_details.images[0]}" alt="${listing.listing_details.title}" />`
+              ? `<img src="${thumbnailUrl(listing.listing_details.images[0])}" alt="${listing.listing_details.title}" />`
               : '<div class="no-image">No image</div>'
             }
             </div>
@@ -566,7 +573,7 @@ export default function Index() {
                   const listingId = `listing-${index}`;
                   const isExpanded = expandedListings[listingId] || false;
                   const thumbnailImage = listing.listing_details.images && listing.listing_details.images.length > 0
-                    ? listing.listing_details.images[0]
+                    ? thumbnailUrl(listing.listing_details.images[0])
                     : 'https://placehold.co/400x300?text=No+Image';
 
                   return (